@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Write-behind audit log of every prediction backend.py serves.
+
+record() only appends a tuple to a bounded in-memory ring buffer, so the
+request path never waits on disk. A background thread drains the buffer
+every flush_interval seconds (or as soon as batch_size records are waiting)
+and inserts them in one transaction into an append-only SQLite table in WAL
+mode. close() flushes what is left on shutdown. If the disk falls so far
+behind that the buffer fills, the oldest unflushed records are dropped and
+counted rather than blocking requests.
+
+Look records up by input digest or time range:
+
+    python3 audit_log.py --digest 3f2a...            # sha256 of the upload, prefix is enough
+    python3 audit_log.py --since 2025-01-01T09:00 --until 2025-01-01T17:00
+    python3 audit_log.py --since 2025-01-01 --format json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+AUDIT_CONFIG = {
+    'db_path': os.environ.get('AUDIT_DB', 'prediction_audit.db'),
+    'capacity': 10000,  # records held in memory before the oldest are dropped
+    'batch_size': 256,  # wake the writer early once this many are waiting
+    'flush_interval': 1.0,  # seconds
+}
+
+COLUMNS = ('timestamp', 'digest', 'model_version', 'endpoint', 'outcome', 'score', 'latency_ms')
+
+
+def input_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def stream_digest(fileobj):
+    """sha256 of a file object read in chunks, rewound afterwards"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(1 << 20), b''):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def model_version(path):
+    """'<file name>@<sha256 prefix>' identifying the exact weights served"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}@{digest.hexdigest()[:12]}"
+
+
+def connect(db_path):
+    db = sqlite3.connect(db_path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL survives process crashes; only a power cut can lose the last commits
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("""CREATE TABLE IF NOT EXISTS predictions (
+        timestamp REAL NOT NULL, digest TEXT NOT NULL, model_version TEXT NOT NULL,
+        endpoint TEXT NOT NULL, outcome TEXT NOT NULL, score REAL, latency_ms REAL)""")
+    db.execute("CREATE INDEX IF NOT EXISTS predictions_digest ON predictions (digest)")
+    db.execute("CREATE INDEX IF NOT EXISTS predictions_timestamp ON predictions (timestamp)")
+    return db
+
+
+class AuditLog:
+    """Ring buffer of prediction records flushed to SQLite by a background thread"""
+
+    def __init__(self, config=AUDIT_CONFIG):
+        self.config = dict(config)
+        self._db = connect(self.config['db_path'])
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0}
+        self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._writer.start()
+
+    def record(self, digest, model_version, endpoint, outcome, score=None, latency_ms=None):
+        """Queue one record; never touches the disk"""
+        row = (time.time(), digest, model_version, endpoint, outcome,
+               None if score is None else float(score), None if latency_ms is None else round(latency_ms, 3))
+        with self._lock:
+            if len(self._buffer) >= self.config['capacity']:
+                self._buffer.popleft()
+                self.stats['dropped'] += 1
+            self._buffer.append(row)
+            self.stats['recorded'] += 1
+            waiting = len(self._buffer)
+        if waiting >= self.config['batch_size']:
+            self._wake.set()
+
+    def _drain(self):
+        with self._lock:
+            rows = list(self._buffer)
+            self._buffer.clear()
+        return rows
+
+    def flush(self):
+        rows = self._drain()
+        if not rows:
+            return 0
+        try:
+            with self._db:
+                self._db.executemany(f"INSERT INTO predictions ({', '.join(COLUMNS)}) "
+                                     f"VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error:
+            # Put the batch back for the next attempt, still within capacity
+            with self._lock:
+                self._buffer.extendleft(reversed(rows))
+                while len(self._buffer) > self.config['capacity']:
+                    self._buffer.popleft()
+                    self.stats['dropped'] += 1
+            raise
+        self.stats['written'] += len(rows)
+        self.stats['flushes'] += 1
+        return len(rows)
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.config['flush_interval'])
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"⚠️ Audit log flush failed: {e}")
+
+    def close(self):
+        """Stop the writer and flush everything still buffered"""
+        self._stop = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        self._db.close()
+
+    def describe(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {**self.stats, 'buffered': buffered, 'db_path': self.config['db_path']}
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def query(db_path=AUDIT_CONFIG['db_path'], digest=None, since=None, until=None, limit=100):
+    """Records matching a digest prefix and/or [since, until), newest first"""
+    clauses, params = [], []
+    if digest:
+        # Prefix match as an index range scan: every hex extension of the prefix sorts below prefix + 'g'
+        digest = digest.lower()
+        clauses.append("digest >= ? AND digest < ?")
+        params += [digest, digest + 'g']
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    db = connect(db_path)
+    try:
+        rows = db.execute(f"SELECT {', '.join(COLUMNS)} FROM predictions {where} "
+                          f"ORDER BY timestamp DESC LIMIT ?", (*params, limit)).fetchall()
+    finally:
+        db.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+def print_records(records):
+    print(f"{'time':<24}{'digest':<18}{'model':<34}{'endpoint':<16}{'outcome':<10}{'score':>8}{'ms':>9}")
+    for r in records:
+        when = datetime.fromtimestamp(r['timestamp']).isoformat(timespec='milliseconds')
+        score = f"{r['score']:.4f}" if r['score'] is not None else '-'
+        latency = f"{r['latency_ms']:.1f}" if r['latency_ms'] is not None else '-'
+        print(f"{when:<24}{r['digest'][:16]:<18}{r['model_version']:<34}{r['endpoint']:<16}"
+              f"{r['outcome']:<10}{score:>8}{latency:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the prediction audit log")
+    parser.add_argument('--db', default=AUDIT_CONFIG['db_path'])
+    parser.add_argument('--digest', default=None, help="sha256 of the uploaded file, or a prefix of it")
+    parser.add_argument('--since', default=None, help="ISO time or unix timestamp")
+    parser.add_argument('--until', default=None, help="ISO time or unix timestamp")
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--format', choices=['table', 'json'], default='table')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Audit log not found: {args.db}")
+    else:
+        records = query(args.db, args.digest,
+                        _parse_time(args.since) if args.since else None,
+                        _parse_time(args.until) if args.until else None, args.limit)
+        if args.format == 'json':
+            print(json.dumps(records, indent=2))
+        else:
+            print_records(records)
+            print(f"📋 {len(records)} record(s)")
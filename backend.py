@@ -1,17 +1,24 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 import numpy as np
-import cv2
 from PIL import Image
 import io
+import asyncio
 import base64
-try:
-    import tensorflow as tf
-    from gradcam import GradCAM
-except ImportError:
-    tf = None
-    GradCAM = None
+import hashlib
+import time
+from collections import Counter
+from typing import Optional
+
+from audit_log import AuditLog, input_digest, model_version, stream_digest
+from cine import CINE_CONFIG, aggregate_scores, iter_frames, next_batch, sample_frames
+from explain_jobs import ExplainJobs, QueueFull
+from fan_crop import CROP_CONFIG, crop_to_fan
+from quality_gate import QualityGate
+from serving import (ModelSpec, MicroBatcher, TestTimeAugmentation, Cascade, CASCADE_CONFIG, DEFAULT_INPUT_SIZE,
+                     EXPLAIN_METHODS, TTA_MODES)
 
 app = FastAPI(title="Kidney Stone Detection API")
 
@@ -25,40 +32,133 @@ app.add_middleware(
 )
 
 # Global variables
+# TensorFlow, OpenCV and the model load in a background thread after startup (see load_model)
+tf = None
+model_loading = None
 model = None
+model_spec = None
+batcher = None
 gradcam = None
+tta = TestTimeAugmentation()
+gate = QualityGate()
+cascade = None
+explain_jobs = ExplainJobs()
+audit = AuditLog()
+model_versions = {"heavy": "demo"}
 
 @app.on_event("startup")
 async def load_model():
-    global model, gradcam
+    global model_loading
+    # Don't block startup: the port binds while TensorFlow imports and the model deserialises
+    model_loading = asyncio.create_task(load_model_in_background())
+
+async def load_model_in_background():
+    global model, model_spec, batcher, gradcam, cascade
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    loaded = await loop.run_in_executor(None, load_models)
+    if loaded:
+        model, model_spec, gradcam, cheap_spec = loaded
+        batcher = MicroBatcher(model_spec.predict)
+        if cheap_spec:
+            cascade = load_cascade(cheap_spec)
+        print(f"⏱️  Model ready {time.perf_counter() - start:.1f}s after startup")
+    # Modules only /explain needs, so the first explanation doesn't pay for them
+    await loop.run_in_executor(None, warm_imports)
+
+def load_models():
+    """(model, spec, explainer, cheap model spec) loaded in a worker thread, or None for demo mode"""
+    global tf
     
     # Check if we have a model file
-    if os.path.exists("kidney_stone_model.h5"):
-        try:
-            if tf:
-                model = tf.keras.models.load_model("kidney_stone_model.h5")
-                print("✅ AI model loaded successfully!")
-            else:
-                print("⚠️ TensorFlow not available - using demo mode")
-                model = None
-        except Exception as e:
-            print(f"⚠️ Model file exists but can't load: {e}")
-            print("Using demo predictions")
-            model = None
-    else:
+    if not os.path.exists("kidney_stone_model.h5"):
         print("❌ No model file found. Run: python3 minimal_model.py")
-        model = None
+        return None
+    try:
+        import tensorflow
+        tf = tensorflow
+    except ImportError:
+        print("⚠️ TensorFlow not available - using demo mode")
+        return None
+    try:
+        loaded = tf.keras.models.load_model("kidney_stone_model.h5")
+        spec = ModelSpec(loaded)
+        model_versions["heavy"] = model_version("kidney_stone_model.h5")
+        print("✅ AI model loaded successfully!")
+        print(f"   Input: {spec.input_size}, outputs: {spec.output_names}")
+    except Exception as e:
+        print(f"⚠️ Model file exists but can't load: {e}")
+        print("Using demo predictions")
+        return None
+    return loaded, spec, load_explainer(loaded), load_cheap_model()
+
+def warm_imports():
+    import heatmap_render  # noqa: F401 - pulls in OpenCV
+
+async def wait_for_model():
+    """Hold requests that arrive while the model is still loading instead of answering with demo scores"""
+    if model_loading and not model_loading.done():
+        await asyncio.shield(model_loading)
+
+def load_explainer(model):
+    """CAM/Grad-CAM for /explain; gradient-free CAM when the head is global pooling + dense"""
+    try:
+        from gradcam import GradCAM
+        explainer = GradCAM(model)
+        print(f"✅ Explanations: {explainer.describe()['default_method']} on {explainer.features.name}")
+        return explainer
+    except Exception as e:
+        print(f"⚠️ Can't explain this model ({e}) - using demo heatmaps")
+        return None
 
-def preprocess_image(image_bytes):
+def load_cheap_model():
+    """Cheap first-stage model spec, if one has been distilled and calibrated with cascade.py"""
+    if not (os.path.exists(CASCADE_CONFIG['cheap_model']) and os.path.exists(CASCADE_CONFIG['thresholds'])):
+        return None
+    try:
+        cheap_spec = ModelSpec(tf.keras.models.load_model(CASCADE_CONFIG['cheap_model'], compile=False))
+        model_versions["cheap"] = model_version(CASCADE_CONFIG['cheap_model'])
+        return cheap_spec
+    except Exception as e:
+        print(f"⚠️ Cascade files exist but can't load: {e}")
+        return None
+
+def load_cascade(cheap_spec):
+    try:
+        stage = Cascade.from_thresholds(cheap_spec, MicroBatcher(cheap_spec.predict), CASCADE_CONFIG['thresholds'])
+        print(f"✅ Cascade enabled: escalating scores in [{stage.low:.3f}, {stage.high:.3f}]")
+        return stage
+    except Exception as e:
+        print(f"⚠️ Cascade thresholds can't load: {e}")
+        return None
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher:
+        await batcher.close()
+    if cascade:
+        await cascade.batcher.close()
+    explain_jobs.close()
+    audit.close()
+
+def input_size():
+    return model_spec.input_size if model_spec else DEFAULT_INPUT_SIZE
+
+def preprocess_image(image_bytes, size=DEFAULT_INPUT_SIZE):
     # Convert bytes to PIL Image
-    image = Image.open(io.BytesIO(image_bytes))
-    
+    return preprocess_pil(Image.open(io.BytesIO(image_bytes)), size)
+
+def preprocess_pil(image, size=DEFAULT_INPUT_SIZE):
     # Convert to RGB if needed
     if image.mode != 'RGB':
         image = image.convert('RGB')
     
+    # Drop borders and overlays around the fan, as in training (FAN_CROP=1)
+    if CROP_CONFIG['enabled']:
+        image = crop_to_fan(image)
+    
     # Resize to model input size
-    image = image.resize((224, 224))
+    image = image.resize(size)
     
     # Convert to numpy array and normalize
     img_array = np.array(image) / 255.0
@@ -66,19 +166,77 @@ def preprocess_image(image_bytes):
     
     return img_array, np.array(image)
 
+def preprocess_frame(frame, size=DEFAULT_INPUT_SIZE, rejected=None):
+    """One cine-loop frame as a (H, W, 3) float32 model input, or None if the quality gate rejects it"""
+    img_array, resized_img = preprocess_pil(frame, size)
+    rejections = gate.check(resized_img, frame.size)
+    if rejections:
+        rejected.append(rejections)
+        return None
+    return img_array[0].astype(np.float32)
+
+def check_quality(image_bytes, resized_img):
+    """422 response for inputs the model should not score, else None"""
+    rejections = gate.check(resized_img, Image.open(io.BytesIO(image_bytes)).size)
+    if rejections:
+        return JSONResponse(status_code=422, content={
+            "error": "Image rejected by quality check",
+            "rejections": rejections
+        })
+    return None
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(file: UploadFile = File(...), tta_mode: Optional[str] = None,
+                  latency_budget_ms: Optional[float] = None):
+    if tta_mode is not None and tta_mode not in TTA_MODES:
+        raise HTTPException(status_code=400, detail=f"tta_mode must be one of {', '.join(TTA_MODES)}")
+    start = time.perf_counter()
+    image_bytes = await file.read()
+    digest = input_digest(image_bytes)
+    await wait_for_model()
     try:
-        # Read and preprocess image
-        image_bytes = await file.read()
-        img_array, original_img = preprocess_image(image_bytes)
+        # Preprocess image
+        img_array, original_img = preprocess_image(image_bytes, input_size())
+        rejected = check_quality(image_bytes, original_img)
+        if rejected:
+            audit.record(digest, model_versions["heavy"], "/predict", "rejected",
+                         latency_ms=(time.perf_counter() - start) * 1000)
+            return rejected
         
+        outputs = None
+        tta_info = None
+        stage = None
         if model and tf:
-            # Real AI prediction
-            prediction = model.predict(img_array)[0][0]
+            if cascade:
+                # Cheap first stage settles confident scans; only its uncertain band reaches the heavy model
+                cheap_array, _ = preprocess_image(image_bytes, cascade.spec.input_size)
+                outputs, prediction = await cascade.run_cheap(cheap_array[0].astype(np.float32))
+                stage = "cheap"
+
+            if stage is None or cascade.escalate(prediction):
+                # Real AI prediction, batched with concurrent requests of the same resolution
+                image = img_array[0].astype(np.float32)
+                predict_start = time.perf_counter()
+                outputs = await batcher.submit(image)
+                prediction = float(outputs[model_spec.primary_output][0])
+
+                # Borderline scans: re-score flipped/shifted/gamma views in one batch
+                now = time.perf_counter()
+                if tta.should_run(prediction, tta_mode, latency_budget_ms,
+                                  elapsed_ms=(now - start) * 1000, plain_ms=(now - predict_start) * 1000):
+                    outputs, view_outputs = await tta.run(batcher, image, model_spec.primary_output)
+                    view_scores = view_outputs[model_spec.primary_output][:, 0]
+                    tta_info = {
+                        "views": len(view_scores),
+                        "plain_score": prediction,
+                        "view_std": float(np.std(view_scores))
+                    }
+                    prediction = float(outputs[model_spec.primary_output][0])
+                if cascade:
+                    cascade.record('heavy', predict_start)
+                stage = "heavy"
         else:
             # Smart demo prediction based on image characteristics
-            import hashlib
             image_hash = hashlib.md5(image_bytes).hexdigest()
             prediction = (int(image_hash[:8], 16) % 100) / 100.0
         
@@ -90,48 +248,204 @@ async def predict(file: UploadFile = File(...)):
             label = "Normal"
             confidence_score = 1 - prediction
         
-        return {
+        response = {
             "prediction": label,
             "confidence": round(confidence_score * 100, 2),
             "raw_score": float(prediction)
         }
+        if outputs is not None:
+            # Every model head, e.g. stone_detection and stone_size
+            response["outputs"] = {name: value.tolist() for name, value in outputs.items()}
+        if cascade and stage:
+            response["stage"] = stage
+        if tta_info:
+            response["tta"] = tta_info
+        # Buffered in memory; the audit writer thread persists it in batches
+        audit.record(digest, model_versions[stage or "heavy"], "/predict", label, prediction,
+                     (time.perf_counter() - start) * 1000)
+        return response
     
     except Exception as e:
+        audit.record(digest, model_versions["heavy"], "/predict", "error",
+                     latency_ms=(time.perf_counter() - start) * 1000)
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+def render_explanation(img_array, original_img, mode=None, size=None, method=None):
+    """Rendered heatmap as an image data URL; runs on the explanation pool"""
+    from heatmap_render import HEATMAP_CONFIG, render, encode
+    score = None
+    if gradcam:
+        # Gradient-free CAM from one forward pass, or full Grad-CAM
+        cam, method, score = gradcam.explain(img_array.astype(np.float32), method)
+    else:
+        # Demo mode - random coarse activation map, like a last conv layer's
+        cam = np.random.random((7, 7))
+        method = "demo"
+    
+    mime, data = encode(render(original_img, cam, mode, size))
+    response = {
+        "heatmap": f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}",
+        "mode": mode or HEATMAP_CONFIG['mode'],
+        "method": method
+    }
+    if score is not None:
+        response["raw_score"] = score
+    return response
+
+def check_render_options(mode, size, method=None):
+    from heatmap_render import MODES as HEATMAP_MODES
+    if method is not None and method not in EXPLAIN_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(EXPLAIN_METHODS)}")
+    if method is not None and gradcam:
+        try:
+            # e.g. cam on a model whose head doesn't allow it
+            gradcam.resolve(method)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if mode is not None and mode not in HEATMAP_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(HEATMAP_MODES)}")
+    if size is not None and not 0 <= size <= 2048:
+        raise HTTPException(status_code=400, detail="size must be between 0 and 2048")
+
+@app.post("/predict/study")
+async def predict_study(file: UploadFile = File(...)):
+    """Cine loop (multi-frame DICOM, GIF/TIFF or video): per-frame scores and a study-level result"""
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    await wait_for_model()
+    size = input_size()
+    stats = {}
+    rejected = []
+    digest = await loop.run_in_executor(None, stream_digest, file.file)
+    frame_scores = []
+    try:
+        sampled = sample_frames(iter_frames(file.file, file.filename), stats)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Study error: {str(e)}")
+    try:
+        while True:
+            # Decode, sample, quality-check and preprocess off the event loop, one batch of frames at a time
+            try:
+                batch = await loop.run_in_executor(None, next_batch, sampled, CINE_CONFIG['batch_size'],
+                                                   lambda frame: preprocess_frame(frame, size, rejected))
+            except Exception as e:
+                # Unreadable or unsupported upload
+                raise HTTPException(status_code=400, detail=f"Study error: {str(e)}")
+            if batch is None:
+                break
+            indices, arrays = batch
+            try:
+                if model and tf:
+                    scores = (await batcher.run(arrays))[model_spec.primary_output][:, 0]
+                else:
+                    # Demo mode - stable pseudo-scores from the frame contents
+                    scores = [(int(hashlib.md5(a.tobytes()).hexdigest()[:8], 16) % 100) / 100.0 for a in arrays]
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Study prediction error: {str(e)}")
+            frame_scores.extend({"frame": i, "score": float(s)} for i, s in zip(indices, scores))
+    finally:
+        sampled.close()
+    
+    stats["rejected"] = len(rejected)
+    stats["rejections"] = dict(Counter(r["reason"] for frame in rejected for r in frame))
+    if rejected and not frame_scores:
+        audit.record(digest, model_versions["heavy"], "/predict/study", "rejected",
+                     latency_ms=(time.perf_counter() - start) * 1000)
+        return JSONResponse(status_code=422, content={
+            "error": "Every frame rejected by quality check",
+            "rejections": list({r["reason"]: r for frame in rejected for r in frame}.values()),
+            "frames": stats
+        })
+    if not frame_scores:
+        raise HTTPException(status_code=400, detail="Study error: No frames could be decoded")
+    study = aggregate_scores([f["score"] for f in frame_scores])
+    
+    prediction = study["score"]
+    label = "Stone" if prediction > 0.5 else "Normal"
+    confidence_score = prediction if prediction > 0.5 else 1 - prediction
+    audit.record(digest, model_versions["heavy"], "/predict/study", label, prediction, (time.perf_counter() - start) * 1000)
+    return {
+        "prediction": label,
+        "confidence": round(confidence_score * 100, 2),
+        "raw_score": prediction,
+        "study": study,
+        "frames": stats,
+        "frame_scores": frame_scores
+    }
+
 @app.post("/explain")
-async def explain(file: UploadFile = File(...)):
+async def explain(file: UploadFile = File(...), mode: Optional[str] = None, size: Optional[int] = None,
+                  method: Optional[str] = None):
+    await wait_for_model()
+    check_render_options(mode, size, method)
     try:
         # Read and preprocess image
         image_bytes = await file.read()
-        img_array, original_img = preprocess_image(image_bytes)
-        
-        if gradcam:
-            # Generate real GradCAM
-            heatmap = gradcam.generate_gradcam(img_array)
-            overlay = gradcam.create_heatmap_overlay(original_img, heatmap)
-        else:
-            # Demo mode - create fake heatmap
-            heatmap = np.random.random((224, 224))
-            heatmap = cv2.resize(heatmap, (original_img.shape[1], original_img.shape[0]))
-            heatmap = np.uint8(255 * heatmap)
-            heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-            overlay = cv2.addWeighted(original_img, 0.6, heatmap, 0.4, 0)
+        img_array, original_img = preprocess_image(image_bytes, input_size())
+        rejected = check_quality(image_bytes, original_img)
+        if rejected:
+            return rejected
         
-        # Convert overlay to base64
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        return {
-            "heatmap": f"data:image/png;base64,{overlay_base64}"
-        }
+        # Off the event loop and on the explanation pool, so /predict keeps flowing
+        return await explain_jobs.run(render_explanation, img_array, original_img, mode, size, method)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"GradCAM error: {str(e)}")
 
+@app.post("/explain/jobs", status_code=202)
+async def submit_explain_job(file: UploadFile = File(...), mode: Optional[str] = None,
+                             size: Optional[int] = None, method: Optional[str] = None):
+    await wait_for_model()
+    check_render_options(mode, size, method)
+    image_bytes = await file.read()
+    try:
+        img_array, original_img = preprocess_image(image_bytes, input_size())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable image: {str(e)}")
+    rejected = check_quality(image_bytes, original_img)
+    if rejected:
+        return rejected
+    
+    try:
+        job_id = explain_jobs.submit(render_explanation, img_array, original_img, mode, size, method)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Explanation queue full: {str(e)}")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/explain/jobs/{job_id}",
+        "events_url": f"/explain/jobs/{job_id}/events"
+    }
+
+@app.get("/explain/jobs/{job_id}")
+async def get_explain_job(job_id: str):
+    job = explain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/explain/jobs/{job_id}/events")
+async def explain_job_events(job_id: str):
+    if explain_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return StreamingResponse(explain_jobs.events(job_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "model_loaded": model is not None}
+    return {
+        "status": "healthy",
+        "model_loaded": model is not None,
+        "model_loading": bool(model_loading and not model_loading.done()),
+        "model": model_spec.describe() if model_spec else None,
+        "batching": batcher.stats if batcher else None,
+        "explainer": gradcam.describe() if gradcam else None,
+        "quality_gate": gate.describe(),
+        "tta": tta.describe(),
+        "cascade": cascade.describe() if cascade else None,
+        "explain_jobs": explain_jobs.describe(),
+        "audit": audit.describe()
+    }
 
 if __name__ == "__main__":
     import uvicorn
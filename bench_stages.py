@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Stage-level micro-benchmarks for the inference pipeline.
+
+Times each building block of backend.py in isolation on a fixed sample of
+dataset images: preprocess_image, model prediction at batch 1/8/32, heatmap
+colouring, overlay blending, PNG encoding and base64, and the heatmap_render
+modes with their encoding. Every stage gets warmup calls, then repeated
+timed calls; the summary (median, p95, IQR, mean, std, min) is saved as JSON
+together with the commit and library versions so runs can be compared
+between commits.
+
+Usage:
+    python3 bench_stages.py --output benchmarks/stages.json
+    python3 bench_stages.py --compare benchmarks/stages.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+from dataset_index import DATASET_PATH
+from heatmap_render import MODES as HEATMAP_MODES, encode, render
+from load_test import load_images
+
+BATCH_SIZES = (1, 8, 32)
+
+
+def summarise(timings):
+    ms = np.asarray(timings) * 1000
+    q1, median, q3, p95 = np.percentile(ms, [25, 50, 75, 95])
+    return {
+        'calls': len(ms),
+        'median_ms': round(float(median), 4),
+        'p95_ms': round(float(p95), 4),
+        'iqr_ms': round(float(q3 - q1), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'std_ms': round(float(ms.std()), 4),
+        'min_ms': round(float(ms.min()), 4),
+    }
+
+
+def time_stage(fn, inputs, warmup=3, repeats=10):
+    """Time fn on every input, repeats times over the sample, after warmup calls"""
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    timings = []
+    for _ in range(repeats):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            timings.append(time.perf_counter() - start)
+    return summarise(timings)
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_benchmarks(model_path='kidney_stone_model.h5', dataset_path=DATASET_PATH, sample=16,
+                   warmup=3, repeats=10):
+    # backend pulls in FastAPI; import it only when benchmarking
+    import backend
+    from serving import ModelSpec
+
+    images = [data for _, data in load_images(dataset_path, sample)]
+    environment = _environment()
+    stages = {}
+
+    model = None
+    if os.path.exists(model_path):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            tf = None
+        if tf:
+            model = tf.keras.models.load_model(model_path, compile=False)
+            environment['tensorflow'] = tf.__version__
+            environment['model'] = model_path
+    size = ModelSpec(model).input_size if model else backend.DEFAULT_INPUT_SIZE
+
+    print(f"⏱️  {len(images)} images, {warmup} warmup + {repeats} repeats per stage, input {size}")
+    stages['preprocess_image'] = time_stage(lambda data: backend.preprocess_image(data, size),
+                                            images, warmup, repeats)
+    preprocessed = [backend.preprocess_image(data, size) for data in images]
+    arrays = np.concatenate([array for array, _ in preprocessed]).astype(np.float32)
+    originals = [original for _, original in preprocessed]
+
+    if model:
+        spec = ModelSpec(model)
+        for batch_size in BATCH_SIZES:
+            batches = [np.resize(arrays, (batch_size, *arrays.shape[1:]))]
+            result = time_stage(spec.predict, batches, warmup, max(repeats, 5))
+            result['per_image_ms'] = round(result['median_ms'] / batch_size, 4)
+            stages[f'predict_batch_{batch_size}'] = result
+    else:
+        print(f"⚠️ {model_path} not found or TensorFlow missing - skipping predict stages")
+
+    # A 7x7 class-activation map, as produced from EfficientNet's last conv layer
+    rng = np.random.default_rng(0)
+    cams = [rng.random((7, 7)).astype(np.float32) for _ in originals]
+
+    def colour_heatmap(cam):
+        heatmap = cv2.resize(cam, (size[0], size[1]))
+        return cv2.applyColorMap(np.uint8(255 * heatmap), cv2.COLORMAP_JET)
+
+    stages['heatmap_colormap'] = time_stage(colour_heatmap, cams, warmup, repeats)
+    heatmaps = [colour_heatmap(cam) for cam in cams]
+    pairs = list(zip(originals, heatmaps))
+    stages['overlay_blend'] = time_stage(lambda pair: cv2.addWeighted(pair[0], 0.6, pair[1], 0.4, 0),
+                                         pairs, warmup, repeats)
+    overlays = [cv2.addWeighted(original, 0.6, heatmap, 0.4, 0) for original, heatmap in pairs]
+    stages['png_encode'] = time_stage(lambda overlay: cv2.imencode('.png', overlay), overlays, warmup, repeats)
+    encoded = [cv2.imencode('.png', overlay)[1] for overlay in overlays]
+    stages['base64_encode'] = time_stage(lambda buffer: base64.b64encode(buffer).decode('utf-8'),
+                                         encoded, warmup, repeats)
+
+    # heatmap_render: uint8 colouring and blending at the configured output size
+    cam_pairs = list(zip(originals, cams))
+    for mode in HEATMAP_MODES:
+        stages[f'render_{mode}'] = time_stage(lambda pair: render(*pair, mode), cam_pairs, warmup, repeats)
+    rendered = [render(original, cam) for original, cam in cam_pairs]
+    stages['render_encode'] = time_stage(encode, rendered, warmup, repeats)
+
+    return {'environment': environment, 'sample': len(images), 'warmup': warmup, 'repeats': repeats,
+            'stages': stages}
+
+
+def print_results(results, baseline=None):
+    header = f"{'stage':<20}{'median ms':>11}{'p95 ms':>10}{'iqr ms':>10}"
+    print(header + (f"{'baseline':>11}{'change':>9}" if baseline else ''))
+    for name, stats in results['stages'].items():
+        line = f"{name:<20}{stats['median_ms']:>11.3f}{stats['p95_ms']:>10.3f}{stats['iqr_ms']:>10.3f}"
+        base = baseline['stages'].get(name) if baseline else None
+        if base:
+            change = stats['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+            line += f"{base['median_ms']:>11.3f}{change:>+9.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark each inference pipeline stage")
+    parser.add_argument('--model', default='kidney_stone_model.h5')
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--sample', type=int, default=16, help="number of dataset images")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--output', default=None, help="save results as JSON")
+    parser.add_argument('--compare', default=None, help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.model, args.dataset, args.sample, args.warmup, args.repeats)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"📊 Comparing with {args.compare} (commit {baseline['environment'].get('commit')})")
+    print_results(results, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to: {args.output}")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Offline threshold calibration for the two-stage serving cascade.
+
+The cheap model (e.g. the student from distill.py) scores every request;
+scores below the low threshold are answered "Normal" and scores above the
+high threshold "Stone" straight away, everything in between is escalated to
+the heavy model. The thresholds are picked on the validation split so the
+cheap stage alone misses at most target_miss_rate of the stones the heavy
+model finds (and raises at most target_false_alarm of its normals).
+
+backend.py enables the cascade when the cheap model and the thresholds file
+written here both exist.
+
+Usage:
+    python3 cascade.py --cheap kidney_stone_student.h5 --heavy kidney_stone_model.h5 --miss-rate 0.01
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import DATASET_PATH, split_entries
+from distill import measure_latency, predict_scores
+from serving import CASCADE_CONFIG
+
+
+def choose_thresholds(cheap_scores, labels, target_miss_rate=0.01, target_false_alarm=0.05):
+    """(low, high): at most target_miss_rate of positives score below low, target_false_alarm of negatives above high"""
+    positives = np.sort(cheap_scores[labels == 1])
+    negatives = np.sort(cheap_scores[labels == 0])[::-1]
+    low = float(positives[int(target_miss_rate * len(positives))]) if len(positives) else 0.0
+    high = float(negatives[int(target_false_alarm * len(negatives))]) if len(negatives) else 1.0
+    # Keep 0.5 inside the band so settled scores agree with the usual decision rule
+    return min(low, 0.5), max(high, 0.5)
+
+
+def simulate(cheap_scores, heavy_scores, labels, low, high):
+    """Cascade decisions, escalation rate and recall on scored data"""
+    escalated = (cheap_scores >= low) & (cheap_scores <= high)
+    final = np.where(escalated, heavy_scores, cheap_scores)
+    stones = labels == 1
+    return {
+        'escalation_rate': float(escalated.mean()),
+        'cascade_recall': float((final[stones] > 0.5).mean()) if stones.any() else None,
+        'heavy_recall': float((heavy_scores[stones] > 0.5).mean()) if stones.any() else None,
+        'cascade_accuracy': float(((final > 0.5) == stones).mean()),
+        'heavy_accuracy': float(((heavy_scores > 0.5) == stones).mean()),
+    }
+
+
+def calibrate(cheap_path, heavy_path, target_miss_rate=0.01, target_false_alarm=0.05,
+              data_path=DATASET_PATH, output_path=CASCADE_CONFIG['thresholds']):
+    cheap = tf.keras.models.load_model(cheap_path, compile=False)
+    heavy = tf.keras.models.load_model(heavy_path, compile=False)
+
+    val_entries = split_entries('val', data_path)
+    labels = np.array([1 if e['label'] == 'stone' else 0 for e in val_entries])
+    cheap_scores = predict_scores(cheap, val_entries, data_path)
+    heavy_scores = predict_scores(heavy, val_entries, data_path)
+
+    # Calibrate against the heavy model's decisions: the cascade should not lose what it would find
+    heavy_labels = (heavy_scores > 0.5).astype(int)
+    low, high = choose_thresholds(cheap_scores, heavy_labels, target_miss_rate, target_false_alarm)
+    result = simulate(cheap_scores, heavy_scores, labels, low, high)
+
+    latency = {'cheap_ms': measure_latency(cheap), 'heavy_ms': measure_latency(heavy)}
+    latency['expected_ms'] = latency['cheap_ms'] + result['escalation_rate'] * latency['heavy_ms']
+
+    thresholds = {
+        'cheap_model': cheap_path,
+        'heavy_model': heavy_path,
+        'low': low,
+        'high': high,
+        'target_miss_rate': target_miss_rate,
+        'target_false_alarm': target_false_alarm,
+        'validation': {**result, **latency},
+    }
+    with open(output_path, 'w') as f:
+        json.dump(thresholds, f, indent=2)
+
+    print(f"🎚️  Escalate scores in [{low:.3f}, {high:.3f}] to {heavy_path}")
+    print(f"   Escalation rate: {result['escalation_rate']:.1%}")
+    print(f"   Recall: cascade {result['cascade_recall']:.3f} vs heavy {result['heavy_recall']:.3f}")
+    print(f"   Latency per image: cheap {latency['cheap_ms']:.2f} ms, heavy {latency['heavy_ms']:.2f} ms, "
+          f"cascade ~{latency['expected_ms']:.2f} ms")
+    print(f"💾 Thresholds saved to: {output_path}")
+    return thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Choose cascade thresholds on the validation split")
+    parser.add_argument('--cheap', default=CASCADE_CONFIG['cheap_model'])
+    parser.add_argument('--heavy', default='kidney_stone_model.h5')
+    parser.add_argument('--miss-rate', type=float, default=0.01,
+                        help="max fraction of stones the cheap stage may settle as Normal")
+    parser.add_argument('--false-alarm', type=float, default=0.05,
+                        help="max fraction of normals the cheap stage may settle as Stone")
+    args = parser.parse_args()
+
+    missing = [path for path in (args.cheap, args.heavy) if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Model not found: {', '.join(missing)}")
+    else:
+        calibrate(args.cheap, args.heavy, args.miss_rate, args.false_alarm)
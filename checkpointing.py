@@ -0,0 +1,267 @@
+"""
+Preemption-safe full-state training checkpoints.
+
+AsyncCheckpoint snapshots model weights, optimizer slots, epoch, training
+phase, RNG state, the progress of the other callbacks (the bests,
+patience counters and best weights of EarlyStopping, ReduceLROnPlateau and
+ModelCheckpoint) and the state of a stateful training iterator (one with
+get_state/set_state, such as ImportanceSampler) at the end of every epoch. The snapshot is a set of
+in-memory numpy copies taken on the training thread; serialising it to disk
+happens on a background writer thread so the next epoch starts immediately.
+
+Each checkpoint is written to a temp file and atomically renamed, and
+latest.json is only updated afterwards, so killing the process at any point
+leaves the previous complete checkpoint intact.
+
+Resuming a two-phase run:
+
+    state = load_checkpoint(CHECKPOINT_DIR)
+    # rebuild/compile the model for state['phase'], then
+    checkpoint = AsyncCheckpoint(CHECKPOINT_DIR, state['phase'], callbacks, train_data)
+    initial_epoch = restore_checkpoint(model, state, train_data, checkpoint)
+    model.fit(..., initial_epoch=initial_epoch, callbacks=callbacks + [checkpoint])
+
+The checkpoint callback must come after the callbacks it tracks so that it
+snapshots them after their epoch update and restores them after fit() has
+reset them.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+CHECKPOINT_DIR = "checkpoints"
+LATEST_FILE = "latest.json"
+
+# Callback attributes that carry progress from one epoch to the next
+CALLBACK_STATE = ('best', 'wait', 'cooldown_counter', 'best_epoch')
+
+
+def _optimizer_variables(optimizer):
+    # Legacy optimizers expose variables() as a method, Keras >= 2.11 as a property
+    variables = optimizer.variables
+    return variables() if callable(variables) else variables
+
+
+def _build_optimizer(model):
+    """Create optimizer slot variables so saved values can be assigned"""
+    optimizer = model.optimizer
+    if hasattr(optimizer, '_create_all_weights'):
+        optimizer._create_all_weights(model.trainable_variables)
+    else:
+        optimizer.build(model.trainable_variables)
+
+
+def _callback_state(callback):
+    state = {}
+    for name in CALLBACK_STATE:
+        value = getattr(callback, name, None)
+        if value is not None:
+            state[name] = float(value) if name == 'best' else int(value)
+    return {'type': type(callback).__name__, 'state': state,
+            'best_weights': getattr(callback, 'best_weights', None)}
+
+
+def _atomic_write(path, write):
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class AsyncCheckpoint(tf.keras.callbacks.Callback):
+    """Save full training state every epoch on a background thread"""
+
+    def __init__(self, directory, phase, callbacks=(), iterator=None, keep=2):
+        super().__init__()
+        self.directory = directory
+        self.phase = phase
+        self.callbacks = list(callbacks)
+        self.iterator = iterator
+        self.keep = keep
+        # Callback state from restore_checkpoint, applied once fit() has reset the callbacks
+        self.pending = None
+        # At most one snapshot waits while another is written, bounding memory
+        self._queue = queue.Queue(maxsize=1)
+        self._writer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def on_train_begin(self, logs=None):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+        if self.pending is not None:
+            self._restore_callbacks(self.pending)
+            self.pending = None
+
+    def _restore_callbacks(self, saved):
+        if [c['type'] for c in saved] != [type(cb).__name__ for cb in self.callbacks]:
+            print("⚠️ Callbacks changed - resuming with fresh callback state")
+            return
+        for callback, entry in zip(self.callbacks, saved):
+            for name, value in entry['state'].items():
+                setattr(callback, name, value)
+            if entry['best_weights'] is not None:
+                callback.best_weights = entry['best_weights']
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._queue.put(self._snapshot(epoch + 1))
+
+    def on_train_end(self, logs=None):
+        self.flush()
+
+    def flush(self):
+        """Block until every queued snapshot is on disk"""
+        self._queue.join()
+
+    def _snapshot(self, epoch):
+        np_state = np.random.get_state()
+        python_state = random.getstate()
+        optimizer = self.model.optimizer
+        return {
+            'epoch': epoch,
+            'phase': self.phase,
+            'learning_rate': float(np.array(optimizer.learning_rate)),
+            'weights': self.model.get_weights(),
+            'optimizer': [v.numpy() for v in _optimizer_variables(optimizer)],
+            'np_rng': np_state,
+            'python_rng': [python_state[0], list(python_state[1]), python_state[2]],
+            'tf_rng': tf.random.get_global_generator().state.numpy(),
+            'callbacks': [_callback_state(cb) for cb in self.callbacks],
+            'iterator': self.iterator.get_state() if hasattr(self.iterator, 'get_state') else None,
+        }
+
+    def _write_loop(self):
+        while True:
+            snapshot = self._queue.get()
+            try:
+                self._write(snapshot)
+            except Exception as e:
+                print(f"⚠️ Checkpoint write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, snapshot):
+        name = f"ckpt-{snapshot['phase']}-{snapshot['epoch']:03d}.npz"
+        arrays = {f'w{i}': w for i, w in enumerate(snapshot['weights'])}
+        arrays.update({f'o{i}': v for i, v in enumerate(snapshot['optimizer'])})
+        arrays['np_rng_keys'] = snapshot['np_rng'][1]
+        arrays['tf_rng'] = snapshot['tf_rng']
+        callbacks = []
+        for i, entry in enumerate(snapshot['callbacks']):
+            best_weights = entry['best_weights']
+            if best_weights is not None:
+                arrays.update({f'c{i}_w{j}': w for j, w in enumerate(best_weights)})
+            callbacks.append({'type': entry['type'], 'state': entry['state'],
+                              'best_weights': None if best_weights is None else len(best_weights)})
+        iterator = None
+        if snapshot['iterator'] is not None:
+            # Arrays (e.g. per-example losses) go in the npz, the rest in latest.json
+            iterator = {}
+            for key, value in snapshot['iterator'].items():
+                if isinstance(value, np.ndarray):
+                    arrays[f'iterator_{key}'] = value
+                else:
+                    iterator[key] = value
+
+        def write_npz(path):
+            with open(path, 'wb') as f:
+                np.savez(f, **arrays)
+
+        _atomic_write(os.path.join(self.directory, name), write_npz)
+
+        np_rng = snapshot['np_rng']
+        metadata = {
+            'file': name,
+            'epoch': snapshot['epoch'],
+            'phase': snapshot['phase'],
+            'learning_rate': snapshot['learning_rate'],
+            'num_weights': len(snapshot['weights']),
+            'num_optimizer': len(snapshot['optimizer']),
+            'np_rng': [np_rng[0], int(np_rng[2]), int(np_rng[3]), float(np_rng[4])],
+            'python_rng': snapshot['python_rng'],
+            'callbacks': callbacks,
+            'iterator': iterator,
+        }
+
+        def write_json(path):
+            with open(path, 'w') as f:
+                json.dump(metadata, f, indent=2)
+
+        # latest.json is the commit point: it only ever names a complete file
+        _atomic_write(os.path.join(self.directory, LATEST_FILE), write_json)
+        self._prune(name)
+
+    def _prune(self, latest_name):
+        checkpoints = sorted(
+            (f for f in os.listdir(self.directory) if f.startswith('ckpt-') and f.endswith('.npz')),
+            key=lambda f: os.path.getmtime(os.path.join(self.directory, f))
+        )
+        for stale in checkpoints[:-self.keep]:
+            if stale != latest_name:
+                os.remove(os.path.join(self.directory, stale))
+
+
+def load_checkpoint(directory):
+    """Metadata + arrays of the latest checkpoint, or None if there isn't one"""
+    latest_path = os.path.join(directory, LATEST_FILE)
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path) as f:
+        state = json.load(f)
+    with np.load(os.path.join(directory, state['file'])) as arrays:
+        state['weights'] = [arrays[f'w{i}'] for i in range(state['num_weights'])]
+        state['optimizer'] = [arrays[f'o{i}'] for i in range(state['num_optimizer'])]
+        state['np_rng_keys'] = arrays['np_rng_keys']
+        state['tf_rng'] = arrays['tf_rng']
+        for i, entry in enumerate(state.get('callbacks', [])):
+            if entry['best_weights'] is not None:
+                entry['best_weights'] = [arrays[f'c{i}_w{j}'] for j in range(entry['best_weights'])]
+        if state.get('iterator') is not None:
+            state['iterator'].update({key[len('iterator_'):]: arrays[key]
+                                      for key in arrays.files if key.startswith('iterator_')})
+    return state
+
+
+def restore_checkpoint(model, state, iterator=None, checkpoint=None):
+    """
+    Load a checkpoint into a compiled model and return the epoch to resume at.
+
+    The model must already be configured for state['phase'] (same frozen
+    layers and optimizer type) so the weight and slot order match. The saved
+    callback state goes to checkpoint (an AsyncCheckpoint tracking the same
+    callbacks), which applies it when fit() starts.
+    """
+    model.set_weights(state['weights'])
+
+    _build_optimizer(model)
+    variables = _optimizer_variables(model.optimizer)
+    if len(variables) == len(state['optimizer']):
+        for variable, value in zip(variables, state['optimizer']):
+            variable.assign(value)
+    else:
+        print("⚠️ Optimizer layout changed - resuming with fresh optimizer state")
+    model.optimizer.learning_rate = state['learning_rate']
+
+    name, pos, has_gauss, cached_gaussian = state['np_rng']
+    np.random.set_state((name, state['np_rng_keys'], pos, has_gauss, cached_gaussian))
+    version, internal, gauss = state['python_rng']
+    random.setstate((version, tuple(internal), gauss))
+    tf.random.get_global_generator().reset(state['tf_rng'])
+
+    if checkpoint is not None:
+        checkpoint.pending = state.get('callbacks', [])
+
+    if hasattr(iterator, 'set_state') and state.get('iterator') is not None:
+        iterator.set_state(state['iterator'])
+
+    if iterator is not None:
+        # The uninterrupted run reshuffles (from the restored RNG state) right after the checkpoint was taken
+        iterator.on_epoch_end()
+
+    print(f"♻️  Resumed {state['phase']} phase at epoch {state['epoch']}")
+    return state['epoch']
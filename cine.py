@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Multi-frame (cine loop) ultrasound ingestion.
+
+Exams often arrive as loops rather than stills: multi-frame DICOM, animated
+GIF or multi-page TIFF, or a short video. iter_frames() decodes any of them
+one frame at a time; sample_frames() drops frames that barely differ from
+the last kept one (mean absolute difference of a 32px grey thumbnail, a few
+microseconds per frame), and next_batch() hands the kept frames to the
+model in fixed-size batches. Only one batch of frames is ever held in
+memory, however long the loop, and at most max_frames are scored.
+
+Per-frame scores are combined into a study-level result: the mean of the
+top-k frame scores by default, so a stone seen clearly in a few frames
+counts without one noisy frame deciding the study.
+
+Video needs OpenCV and DICOM needs pydicom; GIF/TIFF only need Pillow.
+
+    python3 cine.py loop.gif   # decode + sampling stats, no model
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+CINE_CONFIG = {
+    'diff_size': 32,  # px, side of the grey thumbnail consecutive frames are compared on
+    'min_change': 3.0,  # mean absolute grey-level change from the last kept frame to keep a frame
+    'max_frames': 256,  # frames scored per study; decoding stops after this many are kept
+    'max_decoded': 20000,  # hard stop on decoded frames
+    'batch_size': 16,
+    'aggregate': 'topk',  # topk | mean | max
+    'top_k': 3,
+}
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.mpg', '.mpeg', '.wmv')
+
+
+def detect_format(head, filename=None):
+    """'dicom', 'video' or 'image' from the first bytes of the file and its name"""
+    if len(head) >= 132 and head[128:132] == b'DICM':
+        return 'dicom'
+    if filename and filename.lower().endswith(('.dcm', '.dicom')):
+        return 'dicom'
+    if filename and filename.lower().endswith(VIDEO_EXTENSIONS):
+        return 'video'
+    # ISO media (mp4/mov) 'ftyp', AVI 'RIFF....AVI ', Matroska/WebM EBML
+    if head[4:8] == b'ftyp' or (head[:4] == b'RIFF' and head[8:12] == b'AVI ') or head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'video'
+    return 'image'
+
+
+def _image_frames(fileobj):
+    with Image.open(fileobj) as image:
+        # GIF frames after the first may be palette or partial; convert() composites each one
+        for frame in ImageSequence.Iterator(image):
+            yield frame.convert('RGB')
+
+
+def _video_frames(fileobj):
+    # OpenCV only needed for video; it reads from a path, so spool the upload to disk
+    import cv2
+
+    with tempfile.NamedTemporaryFile(suffix='.video') as tmp:
+        shutil.copyfileobj(fileobj, tmp, 1 << 20)
+        tmp.flush()
+        capture = cv2.VideoCapture(tmp.name)
+        if not capture.isOpened():
+            raise ValueError("Could not open video")
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        finally:
+            capture.release()
+
+
+def _to_uint8(frame, bits_stored, invert):
+    if frame.dtype != np.uint8:
+        frame = np.clip(frame.astype(np.float32) * (255.0 / (2 ** bits_stored - 1)), 0, 255).astype(np.uint8)
+    if invert:
+        frame = 255 - frame
+    return frame
+
+
+def _dicom_frames(fileobj):
+    # pydicom only needed for DICOM uploads
+    import pydicom
+
+    dataset = pydicom.dcmread(fileobj, defer_size='1 KB')
+    bits_stored = int(getattr(dataset, 'BitsStored', 8))
+    invert = getattr(dataset, 'PhotometricInterpretation', '') == 'MONOCHROME1'
+    try:
+        # pydicom 3 decodes frame by frame
+        from pydicom.pixels import iter_pixels
+        fileobj.seek(0)
+        frames = iter_pixels(fileobj)
+    except ImportError:
+        # Older pydicom decodes the whole pixel array at once
+        pixels = dataset.pixel_array
+        frames = pixels if int(getattr(dataset, 'NumberOfFrames', 1)) > 1 else [pixels]
+
+    for frame in frames:
+        frame = _to_uint8(np.asarray(frame), bits_stored, invert)
+        yield Image.fromarray(frame).convert('RGB')
+
+
+def iter_frames(fileobj, filename=None):
+    """Decode a still image, GIF/TIFF, video or DICOM upload as a stream of RGB PIL frames"""
+    head = fileobj.read(132)
+    fileobj.seek(0)
+    kind = detect_format(head, filename)
+    if kind == 'dicom':
+        return _dicom_frames(fileobj)
+    if kind == 'video':
+        return _video_frames(fileobj)
+    return _image_frames(fileobj)
+
+
+def thumbnail(frame, size):
+    """Strided (about size x size) grey view of a PIL frame for differencing"""
+    grey = np.asarray(frame.convert('L'))
+    step_y, step_x = max(1, grey.shape[0] // size), max(1, grey.shape[1] // size)
+    return grey[::step_y, ::step_x][:size, :size].astype(np.int16)
+
+
+def sample_frames(frames, stats, config=CINE_CONFIG):
+    """Yield (index, frame) for frames that differ enough from the last kept one; counts go in stats"""
+    stats.update(decoded=0, sampled=0, truncated=False)
+    previous = None
+    try:
+        for index, frame in enumerate(frames):
+            if index >= config['max_decoded'] or stats['sampled'] >= config['max_frames']:
+                stats['truncated'] = True
+                break
+            stats['decoded'] += 1
+            thumb = thumbnail(frame, config['diff_size'])
+            if previous is not None and thumb.shape == previous.shape and \
+                    np.abs(thumb - previous).mean() < config['min_change']:
+                continue
+            previous = thumb
+            stats['sampled'] += 1
+            yield index, frame
+    finally:
+        # Releases the decoder (and the spooled video file) when sampling stops early
+        if hasattr(frames, 'close'):
+            frames.close()
+
+
+def next_batch(sampled, batch_size, preprocess):
+    """
+    (frame indices, stacked preprocessed frames) for up to batch_size sampled
+    frames, or None when done. Frames preprocess returns None for are skipped.
+    """
+    indices, arrays = [], []
+    for index, frame in sampled:
+        array = preprocess(frame)
+        if array is None:
+            continue
+        indices.append(index)
+        arrays.append(array)
+        if len(indices) == batch_size:
+            break
+    if not indices:
+        return None
+    return indices, np.stack(arrays)
+
+
+def aggregate_scores(scores, config=CINE_CONFIG):
+    """Study-level score from per-frame stone scores"""
+    scores = np.sort(np.asarray(scores, dtype=np.float64))[::-1]
+    if len(scores) == 0:
+        raise ValueError("No frames could be decoded")
+    if config['aggregate'] == 'max':
+        study = scores[0]
+    elif config['aggregate'] == 'mean':
+        study = scores.mean()
+    else:
+        study = scores[:config['top_k']].mean()
+    return {
+        'score': float(study),
+        'method': config['aggregate'] if config['aggregate'] != 'topk' else f"top{config['top_k']}_mean",
+        'max': float(scores[0]),
+        'mean': float(scores.mean()),
+        'positive_fraction': float((scores > 0.5).mean()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode a cine loop and report frame sampling")
+    parser.add_argument('path')
+    parser.add_argument('--min-change', type=float, default=CINE_CONFIG['min_change'])
+    args = parser.parse_args()
+
+    config = {**CINE_CONFIG, 'min_change': args.min_change}
+    stats = {}
+    start = time.perf_counter()
+    with open(args.path, 'rb') as f:
+        kept = [index for index, _ in sample_frames(iter_frames(f, os.path.basename(args.path)), stats, config)]
+    elapsed = time.perf_counter() - start
+    print(f"🎞️  {args.path}: {stats['decoded']} frames decoded, {stats['sampled']} kept "
+          f"({elapsed * 1000:.0f} ms){' - truncated' if stats['truncated'] else ''}")
+    print(f"   Kept frames: {kept[:20]}{' ...' if len(kept) > 20 else ''}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Cold-start profile for the serving entry points.
+
+On platforms that scale to zero every first request pays for interpreter
+start, imports and model loading. Two measurements:
+
+- --profile: `python -X importtime` for each entry point, listing the
+  modules its import spends the most time in.
+- the benchmark (default): start the server as a fresh process and time
+  process start -> port accepting connections -> /health answering ->
+  first successful /predict, median over --runs starts.
+
+    python3 cold_start.py --profile
+    python3 cold_start.py --server backend --runs 5
+    python3 cold_start.py --server simple --output cold_start.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from dataset_index import DATASET_PATH
+from load_test import load_images, multipart_body
+from supervisor import REPO_DIR, SERVERS
+
+PROFILE_MODULES = ('backend', 'simple_backend', 'streamlit_app')
+
+STAGES = ('listening', 'healthy', 'first_prediction')
+
+
+def import_profile(module, top=10):
+    """(total seconds, [(seconds, package)]) for the slowest direct imports of module"""
+    # Run in a scratch directory: importing backend opens its job and audit databases
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=workdir,
+                                env={**os.environ, 'PYTHONPATH': REPO_DIR}, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total, imports = None, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1e6
+        elif depth == 1:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return total, sorted(imports, reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=None, headers=None, timeout=120):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def cold_start(server, image, timeout=300, workdir=None):
+    """Seconds from process start to each of STAGES for one fresh server process"""
+    port = free_port()
+    content_type, body = multipart_body(*image)
+    times = {}
+    start = time.perf_counter()
+    process = subprocess.Popen(SERVERS[server](port), cwd=workdir or REPO_DIR, env={**os.environ, 'PORT': str(port)},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while len(times) < len(STAGES):
+            if process.poll() is not None:
+                raise RuntimeError(f"{server} exited with code {process.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"{server} not serving predictions after {timeout}s")
+            try:
+                if 'listening' not in times:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    times['listening'] = time.perf_counter() - start
+                elif 'healthy' not in times:
+                    if request(port, 'GET', '/health')[0] == 200:
+                        times['healthy'] = time.perf_counter() - start
+                elif request(port, 'POST', '/predict', body, {'Content-Type': content_type})[0] == 200:
+                    times['first_prediction'] = time.perf_counter() - start
+                continue
+            except OSError:
+                pass
+            time.sleep(0.02)
+        times['model_loaded'] = json.loads(request(port, 'GET', '/health')[1]).get('model_loaded')
+        return times
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_benchmark(server, runs, image, workdir=None):
+    results = []
+    for run in range(runs):
+        times = cold_start(server, image, workdir=workdir)
+        results.append(times)
+        print(f"   run {run + 1}: " + ', '.join(f"{stage} {times[stage]:.2f}s" for stage in STAGES))
+    summary = {stage: statistics.median(r[stage] for r in results) for stage in STAGES}
+    summary['model_loaded'] = results[-1]['model_loaded']
+    return {'server': server, 'runs': results, 'median': summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile and cold-start benchmark for the servers")
+    parser.add_argument('--profile', action='store_true', help="Import-time profile instead of the benchmark")
+    parser.add_argument('--server', choices=sorted(SERVERS), default='backend')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--image', default=None, help="Image to predict (default: first dataset sample)")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--workdir', default=None, help="Directory the server runs in (model file, databases)")
+    parser.add_argument('--output', default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    if args.profile:
+        for module in PROFILE_MODULES:
+            try:
+                total, imports = import_profile(module)
+            except RuntimeError as e:
+                print(f"⚠️ import {module} failed: {e}")
+                continue
+            print(f"📦 import {module}: {total:.2f}s")
+            for seconds, name in imports:
+                print(f"   {seconds * 1000:8.1f} ms  {name}")
+        return
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = (os.path.basename(args.image), f.read())
+    else:
+        image = load_images(args.dataset, 1)[0]
+    print(f"🚀 Cold-starting {args.server} {args.runs}x")
+    result = run_benchmark(args.server, args.runs, image, args.workdir)
+    median = result['median']
+    print(f"⏱️  Median: port {median['listening']:.2f}s, /health {median['healthy']:.2f}s, "
+          f"first prediction {median['first_prediction']:.2f}s "
+          f"({'model' if median['model_loaded'] else 'demo mode'})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
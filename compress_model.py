@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Compress a trained EfficientNet kidney stone model into a serving artifact.
+
+1. Structured pruning: inside every MBConv block the expanded channels
+   (expand conv -> depthwise conv -> squeeze-excite -> project conv) are
+   ranked by the magnitude of their depthwise BatchNorm scale and the
+   weakest ones are physically removed, so the exported model does less
+   work per image.
+2. Weight clustering: every large kernel is snapped to a few shared values
+   (1D k-means), which makes the artifact compress far better.
+3. Each step is followed by a short fine-tuning recovery phase; while
+   recovering from clustering, weights are re-projected onto their cluster
+   means after every batch so the clustering survives training.
+
+The artifact is saved without optimizer state. The report compares file
+size, load time, peak RSS, latency and AUC against the original, each
+model loaded in a fresh process.
+
+Usage:
+    python3 compress_model.py --model kidney_stone_model.h5 --prune 0.3 --clusters 16
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import DATASET_PATH, split_entries
+from distill import evaluate, load_images, measure_latency
+from training_monitor import peak_rss_mb
+
+REPORT_PATH = "compression_report.json"
+
+COMPRESS_CONFIG = {
+    'prune_ratio': 0.3,  # fraction of expanded channels removed per block
+    'channel_multiple': 8,  # keep channel counts SIMD friendly
+    'clusters': 16,
+    'min_cluster_size': 1024,  # smaller kernels are left alone
+    'prune_epochs': 3,
+    'cluster_epochs': 2,
+    'learning_rate': 1e-4,
+    'batch_size': 32,
+    'auc_tolerance': 0.01,
+}
+
+# Weight axis holding the expanded channels, per MBConv layer suffix
+_BLOCK_AXES = {
+    'expand_conv': {0: 3},
+    'expand_bn': {0: 0, 1: 0, 2: 0, 3: 0},
+    'dwconv': {0: 2},
+    'bn': {0: 0, 1: 0, 2: 0, 3: 0},
+    'se_reduce': {0: 2},
+    'se_expand': {0: 3, 1: 0},
+    'project_conv': {0: 2},
+}
+
+
+def _flat_layers(model):
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            yield from _flat_layers(layer)
+        else:
+            yield layer
+
+
+def _layer_configs(config):
+    """Every serialized layer dict in a (possibly nested) model config"""
+    if isinstance(config, dict):
+        if isinstance(config.get('config'), dict) and 'class_name' in config:
+            yield config
+        for value in config.values():
+            yield from _layer_configs(value)
+    elif isinstance(config, list):
+        for value in config:
+            yield from _layer_configs(value)
+
+
+def channel_plan(model, ratio, multiple=COMPRESS_CONFIG['channel_multiple']):
+    """{block prefix: sorted indices of the expanded channels to keep}"""
+    layers = {layer.name: layer for layer in _flat_layers(model)}
+    plan = {}
+    for name in layers:
+        if not name.endswith('_expand_conv'):
+            continue
+        prefix = name[:-len('expand_conv')]
+        gamma = np.abs(layers[prefix + 'bn'].get_weights()[0])
+        keep = int(np.ceil(len(gamma) * (1 - ratio) / multiple) * multiple)
+        keep = min(len(gamma), max(multiple, keep))
+        plan[prefix] = np.sort(np.argsort(gamma)[::-1][:keep])
+    return plan
+
+
+def prune_channels(model, plan):
+    """Rebuild model with the planned channels only and copy the surviving weights"""
+    config = model.get_config()
+    for layer_config in _layer_configs(config):
+        # Stale build shapes would make layers build with the unpruned widths
+        layer_config.pop('build_config', None)
+        layer_name = layer_config['config'].get('name', '')
+        for prefix, keep in plan.items():
+            if layer_name in (prefix + 'expand_conv', prefix + 'se_expand'):
+                layer_config['config']['filters'] = len(keep)
+            elif layer_name == prefix + 'se_reshape':
+                layer_config['config']['target_shape'] = [1, 1, len(keep)]
+
+    pruned = model.__class__.from_config(config)
+    for old, new in zip(_flat_layers(model), _flat_layers(pruned)):
+        weights = old.get_weights()
+        if not weights:
+            continue
+        for prefix, keep in plan.items():
+            suffix = old.name[len(prefix):] if old.name.startswith(prefix) else None
+            if suffix in _BLOCK_AXES:
+                weights = [np.take(w, keep, axis=_BLOCK_AXES[suffix][i]) if i in _BLOCK_AXES[suffix] else w
+                           for i, w in enumerate(weights)]
+                break
+        new.set_weights(weights)
+    return pruned
+
+
+def cluster_values(values, clusters, iterations=10):
+    """1D k-means; returns (centroids, assignment per value)"""
+    flat = values.ravel()
+    centroids = np.linspace(flat.min(), flat.max(), clusters)
+    for _ in range(iterations):
+        assign = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, flat)
+        counts = np.bincount(assign, minlength=clusters)
+        sums = np.bincount(assign, weights=flat, minlength=clusters)
+        centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+    assign = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, flat)
+    return centroids.astype(values.dtype), assign.astype(np.int32)
+
+
+def cluster_weights(model, clusters=COMPRESS_CONFIG['clusters'], min_size=COMPRESS_CONFIG['min_cluster_size']):
+    """Snap large kernels to their cluster centroids; returns [(variable, assignment)]"""
+    clustered = []
+    for layer in _flat_layers(model):
+        for variable in layer.trainable_weights:
+            if 'kernel' not in variable.name or variable.shape.num_elements() < min_size:
+                continue
+            centroids, assign = cluster_values(variable.numpy(), clusters)
+            variable.assign(centroids[assign].reshape(variable.shape))
+            clustered.append((variable, assign))
+    return clustered
+
+
+class ClusterProjection(tf.keras.callbacks.Callback):
+    """Keep clustered kernels clustered while fine-tuning: snap to cluster means after each batch"""
+
+    def __init__(self, clustered, clusters=COMPRESS_CONFIG['clusters']):
+        super().__init__()
+        self.variables = [variable for variable, _ in clustered]
+        self.assignments = [tf.constant(assign) for _, assign in clustered]
+        self.clusters = clusters
+
+    @tf.function
+    def _project(self):
+        for variable, assign in zip(self.variables, self.assignments):
+            flat = tf.reshape(variable, [-1])
+            centroids = tf.math.unsorted_segment_mean(flat, assign, self.clusters)
+            variable.assign(tf.reshape(tf.gather(centroids, assign), variable.shape))
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._project()
+
+    def on_train_end(self, logs=None):
+        self._project()
+
+
+def _labelled_dataset(entries, size, data_path):
+    labels = np.array([1.0 if e['label'] == 'stone' else 0.0 for e in entries], dtype=np.float32)
+    return tf.data.Dataset.zip((
+        load_images(entries, size, data_path, batch_size=1).unbatch(),
+        tf.data.Dataset.from_tensor_slices(labels)
+    )).shuffle(2048).batch(COMPRESS_CONFIG['batch_size']).prefetch(tf.data.AUTOTUNE)
+
+
+def recover(model, train_data, epochs, callbacks=None):
+    """Short fine-tune of every layer except BatchNorm statistics"""
+    model.trainable = True
+    for layer in _flat_layers(model):
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            layer.trainable = False
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(COMPRESS_CONFIG['learning_rate']),
+        loss='binary_crossentropy'
+    )
+    model.fit(train_data, epochs=epochs, callbacks=callbacks or [], verbose=1)
+
+
+def _process_peak_rss_mb():
+    # ru_maxrss survives exec, so a spawned child would report its parent's peak;
+    # VmHWM is reset with the new address space
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def profile_artifact(path):
+    """Load time, peak RSS and latency of a saved model; run in a fresh process"""
+    baseline_rss = _process_peak_rss_mb()
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(path, compile=False)
+    load_time = time.perf_counter() - start
+    latency_1 = measure_latency(model, 1)
+    latency_32 = measure_latency(model, 32, repeats=10)
+    with open(path, 'rb') as f:
+        gzip_size = len(gzip.compress(f.read()))
+    return {
+        'path': path,
+        'params': int(model.count_params()),
+        'file_mb': round(os.path.getsize(path) / 1e6, 2),
+        'gzip_mb': round(gzip_size / 1e6, 2),
+        'load_s': round(load_time, 3),
+        'peak_rss_mb': round(_process_peak_rss_mb(), 1),
+        'model_rss_mb': round(_process_peak_rss_mb() - baseline_rss, 1),
+        'latency_1_ms': round(latency_1, 3),
+        'latency_32_ms': round(latency_32, 3),
+    }
+
+
+def _profile_in_subprocess(path):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(profile_artifact, path).result()
+
+
+def compress(model_path, output_path='kidney_stone_model_compressed.h5', prune_ratio=COMPRESS_CONFIG['prune_ratio'],
+             clusters=COMPRESS_CONFIG['clusters'], data_path=DATASET_PATH, report_path=REPORT_PATH):
+    model = tf.keras.models.load_model(model_path, compile=False)
+    size = tuple(model.inputs[0].shape[1:3])
+    train_data = _labelled_dataset(split_entries('train', data_path), size, data_path)
+    val_entries = split_entries('val', data_path)
+    test_entries = split_entries('test', data_path)
+
+    # Re-save the original without optimizer state so size comparisons isolate compression
+    stripped_path = os.path.splitext(output_path)[0] + '_stripped.h5'
+    model.save(stripped_path, include_optimizer=False)
+
+    plan = channel_plan(model, prune_ratio)
+    expanded = sum(layer.filters for layer in _flat_layers(model) if layer.name.endswith('_expand_conv'))
+    kept = sum(len(keep) for keep in plan.values())
+    print(f"✂️  Pruning {len(plan)} MBConv blocks: keeping {kept}/{expanded} expanded channels")
+    compressed = prune_channels(model, plan)
+    recover(compressed, train_data, COMPRESS_CONFIG['prune_epochs'])
+
+    print(f"🧩 Clustering kernels to {clusters} shared values")
+    clustered = cluster_weights(compressed, clusters)
+    recover(compressed, train_data, COMPRESS_CONFIG['cluster_epochs'], [ClusterProjection(clustered, clusters)])
+    compressed.save(output_path, include_optimizer=False)
+
+    report = {'prune_ratio': prune_ratio, 'clusters': clusters}
+    for name, path in (('original', model_path), ('stripped', stripped_path), ('compressed', output_path)):
+        report[name] = _profile_in_subprocess(path)
+    for name, candidate in (('original', model), ('compressed', compressed)):
+        report[name]['val_auc'] = evaluate(candidate, val_entries, data_path)
+        report[name]['test_auc'] = evaluate(candidate, test_entries, data_path)
+    auc_drop = report['original']['val_auc'] - report['compressed']['val_auc']
+    report['matched_accuracy'] = bool(auc_drop <= COMPRESS_CONFIG['auc_tolerance'])
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'':<14}{'original':>12}{'stripped':>12}{'compressed':>12}")
+    for key, label in (('params', 'Parameters'), ('file_mb', 'File MB'), ('gzip_mb', 'Gzipped MB'),
+                       ('load_s', 'Load s'), ('peak_rss_mb', 'Peak RSS MB'), ('model_rss_mb', 'Model RSS MB'),
+                       ('latency_1_ms', '1 image ms'), ('latency_32_ms', 'Batch 32 ms')):
+        fmt = '{:>12,}' if key == 'params' else '{:>12.3f}'
+        print(f"{label:<14}" + ''.join(fmt.format(report[n][key]) for n in ('original', 'stripped', 'compressed')))
+    print(f"{'Val AUC':<14}{report['original']['val_auc']:>12.3f}{'':>12}{report['compressed']['val_auc']:>12.3f}")
+    print(f"{'Test AUC':<14}{report['original']['test_auc']:>12.3f}{'':>12}{report['compressed']['test_auc']:>12.3f}")
+    if report['matched_accuracy']:
+        print("✅ Accuracy matched")
+    else:
+        print(f"⚠️ Validation AUC dropped by {auc_drop:.3f} - try a lower --prune ratio or more --clusters")
+    print(f"💾 Serving artifact saved as: {output_path} (report: {report_path})")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune + cluster a trained model into a serving artifact")
+    parser.add_argument('--model', default='kidney_stone_model.h5')
+    parser.add_argument('--output', default='kidney_stone_model_compressed.h5')
+    parser.add_argument('--prune', type=float, default=COMPRESS_CONFIG['prune_ratio'],
+                        help="fraction of expanded channels removed per block")
+    parser.add_argument('--clusters', type=int, default=COMPRESS_CONFIG['clusters'])
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}")
+    else:
+        compress(args.model, args.output, args.prune, args.clusters)
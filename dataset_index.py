@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Dataset index for the kidney ultrasound images.
+
+Builds (and incrementally refreshes) a compact manifest of every image in the
+dataset folder with its label, byte size, dimensions and content hash. Each
+image is assigned to train/val/test from its content hash, so every trainer
+and evaluator sees exactly the same split without re-walking the tree.
+
+Usage:
+    python3 dataset_index.py            # build or update the manifest
+    python3 dataset_index.py --rebuild  # rehash everything from scratch
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+DATASET_PATH = "Kidney Ultrasound Images Stone and No Stone"
+MANIFEST_PATH = "dataset_manifest.json"
+CLASSES = ['Normal', 'stone']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+MANIFEST_VERSION = 1
+
+# Fractions of the 0-9999 hash bucket range given to each split
+SPLIT_FRACTIONS = {'train': 0.70, 'val': 0.15, 'test': 0.15}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """MD5 of a file's contents, read in chunks"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def assign_split(key):
+    """Deterministically map a hash key to 'train', 'val' or 'test'"""
+    bucket = int(hashlib.md5(key.encode()).hexdigest()[:8], 16) % 10000
+    edge = 0
+    for split, fraction in SPLIT_FRACTIONS.items():
+        edge += fraction * 10000
+        if bucket < edge:
+            return split
+    return 'test'
+
+
+def image_size(path):
+    """(width, height) read from the image header without decoding pixels"""
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.size
+
+
+def _scan(dataset_path):
+    """Yield (relative path, label, stat) for every image in the class folders"""
+    for label in CLASSES:
+        class_dir = os.path.join(dataset_path, label)
+        if not os.path.isdir(class_dir):
+            continue
+        with os.scandir(class_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield f"{label}/{entry.name}", label, entry.stat()
+
+
+def build_index(dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH, rebuild=False):
+    """
+    Build or incrementally update the manifest.
+
+    Files whose size and mtime are unchanged since the last run keep their
+    cached hash and dimensions; only new or modified files are read.
+    """
+    previous = {}
+    if not rebuild and os.path.exists(manifest_path):
+        previous = {e['path']: e for e in read_manifest(manifest_path)['entries']}
+
+    entries = []
+    reused = 0
+    for rel_path, label, stat in _scan(dataset_path):
+        old = previous.get(rel_path)
+        if old and old['bytes'] == stat.st_size and old['mtime'] == int(stat.st_mtime):
+            entry = dict(old)
+            reused += 1
+        else:
+            full_path = os.path.join(dataset_path, rel_path)
+            width, height = image_size(full_path)
+            entry = {
+                'path': rel_path,
+                'label': label,
+                'bytes': stat.st_size,
+                'mtime': int(stat.st_mtime),
+                'width': width,
+                'height': height,
+                'md5': file_hash(full_path),
+            }
+        # Near-duplicate clusters from dedupe.py share a group and thus a split
+        entry['split'] = assign_split(entry.get('group', entry['md5']))
+        entries.append(entry)
+
+    entries.sort(key=lambda e: e['path'])
+    write_manifest(entries, dataset_path, manifest_path)
+
+    print(f"📇 Indexed {len(entries)} images ({reused} unchanged, {len(entries) - reused} hashed)")
+    for split, count in split_counts(entries).items():
+        print(f"   {split}: {count}")
+    return entries
+
+
+def write_manifest(entries, dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH):
+    """Atomically write the manifest next to the previous one"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'dataset': dataset_path,
+        'classes': CLASSES,
+        'split_fractions': SPLIT_FRACTIONS,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'entries': entries,
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(manifest_path=MANIFEST_PATH):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {manifest_path}")
+    return manifest
+
+
+def load_manifest(dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH):
+    """Return manifest entries, building the index first if it doesn't exist yet"""
+    if not os.path.exists(manifest_path):
+        return build_index(dataset_path, manifest_path)
+    return read_manifest(manifest_path)['entries']
+
+
+def split_counts(entries):
+    counts = {split: 0 for split in SPLIT_FRACTIONS}
+    for entry in entries:
+        counts[entry['split']] += 1
+    return counts
+
+
+def split_entries(split, dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH, include_duplicates=False):
+    """Manifest entries of one split, skipping near-duplicates flagged by dedupe.py"""
+    return [
+        e for e in load_manifest(dataset_path, manifest_path)
+        if e['split'] == split and (include_duplicates or not e.get('duplicate'))
+    ]
+
+
+def split_frame(split, dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH):
+    """pandas DataFrame of one split, ready for ImageDataGenerator.flow_from_dataframe"""
+    import pandas as pd
+    entries = split_entries(split, dataset_path, manifest_path)
+    return pd.DataFrame(entries, columns=['path', 'label', 'md5'])
+
+
+def flow_from_manifest(datagen, split, dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH,
+                       target_size=(224, 224), batch_size=32, shuffle=None, seed=None, fan_crop=None):
+    """Keras iterator over one manifest split; drop-in for flow_from_directory"""
+    if shuffle is None:
+        shuffle = split == 'train'
+    if fan_crop is None:
+        # Imported here so the manifest tools don't pull in TensorFlow
+        from fan_crop import CROP_CONFIG
+        fan_crop = CROP_CONFIG['enabled']
+
+    if fan_crop:
+        from fan_crop import FanCropIterator, entry_boxes
+        entries = split_entries(split, dataset_path, manifest_path)
+        return FanCropIterator(
+            [os.path.join(dataset_path, e['path']) for e in entries],
+            [CLASSES.index(e['label']) for e in entries],
+            entry_boxes(entries, dataset_path),
+            datagen,
+            class_indices={name: i for i, name in enumerate(CLASSES)},
+            target_size=target_size,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            seed=seed
+        )
+
+    return datagen.flow_from_dataframe(
+        split_frame(split, dataset_path, manifest_path),
+        directory=dataset_path,
+        x_col='path',
+        y_col='label',
+        target_size=target_size,
+        batch_size=batch_size,
+        class_mode='binary',
+        classes=CLASSES,
+        shuffle=shuffle,
+        seed=seed,
+        validate_filenames=False
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dataset manifest")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--rebuild', action='store_true', help="ignore cached hashes")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        print(f"❌ Dataset not found: {args.dataset}")
+        return
+
+    build_index(args.dataset, args.manifest, rebuild=args.rebuild)
+    print(f"💾 Manifest saved as: {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
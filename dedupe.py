@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for the kidney ultrasound dataset.
+
+Computes a 256-bit difference hash (dHash) per image in parallel, then finds
+near-duplicate clusters with a blocked, vectorised Hamming-distance search
+over the bit-packed hashes. Clusters are written back into the dataset
+manifest so that every member of a cluster lands in the same split and only
+one copy per label is used for training and evaluation.
+
+Usage:
+    python3 dedupe.py                   # hash, cluster, update manifest
+    python3 dedupe.py --report-only     # just print/save the cluster report
+    python3 dedupe.py --max-distance 12 # looser near-duplicate threshold
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_index import (
+    DATASET_PATH, MANIFEST_PATH, assign_split, load_manifest, split_counts, write_manifest
+)
+
+HASH_SIZE = 16  # 16x16 gradient bits -> 256-bit hash
+MAX_DISTANCE = 8  # differing bits (of 256) still considered a near-duplicate
+REPORT_PATH = "duplicate_clusters.json"
+
+# Number of set bits for every 16-bit value
+_POPCOUNT16 = np.unpackbits(np.arange(65536, dtype=np.uint16).view(np.uint8).reshape(-1, 2), axis=1).sum(axis=1).astype(np.uint8)
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """Difference hash of an image as a hex string"""
+    from PIL import Image
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale in the DCT domain instead of decoding full size
+        image.draft('L', (hash_size * 4, hash_size * 4))
+        small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes().hex()
+
+
+def compute_hashes(paths, workers=None):
+    """dHash every path using a process pool"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(dhash, paths, chunksize=64))
+
+
+def pack_hashes(hex_hashes):
+    """(n, hash bytes) uint8 array from hex strings"""
+    return np.frombuffer(bytes.fromhex(''.join(hex_hashes)), dtype=np.uint8).reshape(len(hex_hashes), -1)
+
+
+def near_duplicate_pairs(packed, max_distance=MAX_DISTANCE, block_size=256):
+    """
+    Index pairs (i, j), i < j, whose hashes differ in at most max_distance bits.
+
+    Each block of rows is XORed against all later rows at once and the
+    differing bits are counted through a 16-bit popcount lookup table.
+    """
+    words = np.ascontiguousarray(packed).view(np.uint16)
+    n = len(words)
+    pairs = []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        diff = words[start:stop, None, :] ^ words[None, start:, :]
+        distance = _POPCOUNT16[diff].sum(axis=2, dtype=np.uint16)
+        rows, cols = np.nonzero(distance <= max_distance)
+        rows += start
+        cols += start
+        upper = cols > rows
+        pairs.append(np.stack([rows[upper], cols[upper]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(pairs)
+
+
+def cluster_labels(n, pairs):
+    """Connected-component id for each of n items given near-duplicate pairs"""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.uint8), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def find_clusters(entries, max_distance=MAX_DISTANCE):
+    """Lists of entry indices for every cluster with more than one member"""
+    packed = pack_hashes([e['phash'] for e in entries])
+    labels = cluster_labels(len(entries), near_duplicate_pairs(packed, max_distance))
+    order = np.argsort(labels, kind='stable')
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    return [group.tolist() for group in np.split(order, boundaries) if len(group) > 1]
+
+
+def apply_clusters(entries, clusters):
+    """
+    Tag manifest entries with their cluster so splits are leakage-free.
+
+    All members share the representative's hash as 'group' (and therefore
+    one split). Within a cluster only the first image of each label is kept;
+    the rest are marked 'duplicate' and skipped by the trainers.
+    """
+    for entry in entries:
+        entry.pop('group', None)
+        entry.pop('duplicate', None)
+
+    for cluster in clusters:
+        members = sorted(cluster, key=lambda i: entries[i]['path'])
+        group = entries[members[0]]['md5']
+        seen_labels = set()
+        for i in members:
+            entries[i]['group'] = group
+            if entries[i]['label'] in seen_labels:
+                entries[i]['duplicate'] = True
+            seen_labels.add(entries[i]['label'])
+
+    for entry in entries:
+        entry['split'] = assign_split(entry.get('group', entry['md5']))
+
+
+def cluster_report(entries, clusters):
+    report = {'clusters': [], 'duplicates': 0, 'mixed_label_clusters': 0, 'cross_split_clusters': 0}
+    for cluster in clusters:
+        members = [entries[i] for i in cluster]
+        labels = {e['label'] for e in members}
+        # Splits each member would get from its own hash, i.e. without grouping
+        independent_splits = {assign_split(e['md5']) for e in members}
+        report['duplicates'] += len(members) - len(labels)
+        report['mixed_label_clusters'] += len(labels) > 1
+        report['cross_split_clusters'] += len(independent_splits) > 1
+        report['clusters'].append({
+            'size': len(members),
+            'labels': sorted(labels),
+            'paths': sorted(e['path'] for e in members),
+        })
+    report['clusters'].sort(key=lambda c: -c['size'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images in the dataset")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--max-distance', type=int, default=MAX_DISTANCE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--report-only', action='store_true', help="don't update the manifest")
+    args = parser.parse_args()
+
+    entries = load_manifest(args.dataset, args.manifest)
+
+    # Hashes are cached in the manifest; only new or changed images are decoded
+    missing = [e for e in entries if 'phash' not in e]
+    if missing:
+        print(f"🔍 Hashing {len(missing)} images...")
+        paths = [os.path.join(args.dataset, e['path']) for e in missing]
+        for entry, value in zip(missing, compute_hashes(paths, args.workers)):
+            entry['phash'] = value
+
+    clusters = find_clusters(entries, args.max_distance)
+    report = cluster_report(entries, clusters)
+
+    print(f"📊 Near-duplicate clusters (<= {args.max_distance} bits): {len(clusters)}")
+    print(f"   Images in clusters: {sum(len(c) for c in clusters)}")
+    print(f"   Redundant copies: {report['duplicates']}")
+    print(f"   Clusters mixing Normal/stone: {report['mixed_label_clusters']}")
+    print(f"   Clusters that leaked across splits: {report['cross_split_clusters']}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Cluster report saved as: {args.report}")
+
+    if args.report_only:
+        if missing:
+            write_manifest(entries, args.dataset, args.manifest)
+        return
+
+    apply_clusters(entries, clusters)
+    write_manifest(entries, args.dataset, args.manifest)
+    kept = [e for e in entries if not e.get('duplicate')]
+    print(f"✅ Deduplicated split written to {args.manifest}")
+    for split, count in split_counts(kept).items():
+        print(f"   {split}: {count}")
+
+
+if __name__ == "__main__":
+    main()
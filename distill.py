@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation of a trained teacher into a tiny CPU-serving student.
+
+The teacher's scores over the training split are computed once and cached
+(keyed by image hash, for one teacher file and crop setting), then a small
+Conv2D + GAP student is trained on a mix of the hard labels and the
+temperature-softened teacher scores. The student architecture is the largest
+one in STUDENT_CONFIGS whose measured single-image CPU latency fits the
+budget.
+
+Usage:
+    python3 distill.py --teacher kidney_stone_model.h5 --latency-ms 5
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from sklearn.metrics import roc_auc_score
+
+from audit_log import model_version
+from dataset_index import DATASET_PATH, split_entries
+from fan_crop import CROP_CONFIG, entry_boxes
+
+SOFT_TARGETS_PATH = "teacher_soft_targets.npz"
+REPORT_PATH = "distillation_report.json"
+
+# Conv widths of each student, smallest first
+STUDENT_CONFIGS = {
+    'nano': [8, 16, 32],
+    'tiny': [16, 32, 64],
+    'small': [16, 32, 64, 128],
+    'base': [24, 48, 96, 192],
+}
+
+DISTILL_CONFIG = {
+    'temperature': 3.0,
+    'alpha': 0.3,  # weight of the hard-label loss
+    'epochs': 30,
+    'batch_size': 32,
+    'learning_rate': 2e-3,
+}
+
+
+def create_student_model(widths, input_shape=(224, 224, 3)):
+    """Strided Conv2D stack + GAP; returns (serving model, logit model) sharing weights"""
+    inputs = tf.keras.layers.Input(shape=input_shape)
+    x = inputs
+    for width in widths:
+        x = tf.keras.layers.Conv2D(width, 3, strides=2, padding='same', use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    logits = tf.keras.layers.Dense(1, name='logit', dtype='float32')(x)
+    probability = tf.keras.layers.Activation('sigmoid', name='stone_detection', dtype='float32')(logits)
+    return tf.keras.Model(inputs, probability), tf.keras.Model(inputs, logits)
+
+
+def distillation_loss(temperature=DISTILL_CONFIG['temperature'], alpha=DISTILL_CONFIG['alpha']):
+    """y_true columns: [hard label, teacher probability]; y_pred: student logits"""
+    def loss(y_true, logits):
+        hard, teacher_prob = y_true[:, :1], y_true[:, 1:]
+        teacher_prob = tf.clip_by_value(teacher_prob, 1e-6, 1 - 1e-6)
+        teacher_logit = tf.math.log(teacher_prob / (1 - teacher_prob))
+        soft_target = tf.sigmoid(teacher_logit / temperature)
+        hard_loss = tf.nn.sigmoid_cross_entropy_with_logits(hard, logits)
+        # T^2 keeps the soft-loss gradients on the same scale as the hard loss
+        soft_loss = tf.nn.sigmoid_cross_entropy_with_logits(soft_target, logits / temperature) * temperature ** 2
+        return tf.reduce_mean(alpha * hard_loss + (1 - alpha) * soft_loss)
+    return loss
+
+
+def load_images(entries, size, data_path=DATASET_PATH, batch_size=32):
+    """tf.data of [0, 1] images resized to size, in manifest order"""
+    paths = [os.path.join(data_path, e['path']) for e in entries]
+    boxes = entry_boxes(entries, data_path) if CROP_CONFIG['enabled'] else None
+
+    def load(path, box=None):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        if box is not None:
+            image = image[box[1]:box[3], box[0]:box[2]]  # cached fan crop
+        return tf.image.resize(image, size) / 255.0
+
+    slices = paths if boxes is None else (paths, boxes)
+    return tf.data.Dataset.from_tensor_slices(slices).map(load, num_parallel_calls=tf.data.AUTOTUNE) \
+        .batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def teacher_soft_targets(teacher, teacher_version, entries, data_path=DATASET_PATH, cache_path=SOFT_TARGETS_PATH):
+    """
+    Teacher probabilities for entries, computed once and cached by image hash.
+    teacher_version (audit_log.model_version of the teacher file) keys the
+    cache together with the crop setting and input size.
+    """
+    size = tuple(teacher.inputs[0].shape[1:3])
+    # Scores are only reusable for the same weights, crop and input size
+    identity = json.dumps({'teacher': teacher_version, 'input_size': size,
+                           'fan_crop': CROP_CONFIG if CROP_CONFIG['enabled'] else False}, sort_keys=True)
+    cache = {}
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if 'identity' in cached and str(cached['identity']) == identity:
+                cache = dict(zip(cached['md5'], cached['prob']))
+            else:
+                print(f"♻️  {cache_path} was scored by a different teacher or crop setting - rescoring")
+
+    missing = [e for e in entries if e['md5'] not in cache]
+    if missing:
+        print(f"👩‍🏫 Scoring {len(missing)} images with the teacher...")
+        outputs = teacher.predict(load_images(missing, size, data_path), verbose=0)
+        if isinstance(outputs, list):
+            outputs = outputs[0]
+        cache.update(zip((e['md5'] for e in missing), outputs[:, 0]))
+        np.savez(cache_path, md5=np.array(list(cache)), prob=np.array(list(cache.values()), dtype=np.float32),
+                 identity=np.array(identity))
+
+    return np.array([cache[e['md5']] for e in entries], dtype=np.float32)
+
+
+def measure_latency(model, batch_size=1, repeats=50):
+    """Median CPU latency (ms) of a direct forward call"""
+    batch = tf.random.uniform([batch_size, *model.inputs[0].shape[1:]])
+    call = tf.function(lambda x: model(x, training=False))
+    for _ in range(3):
+        call(batch)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call(batch).numpy()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def choose_student(latency_budget_ms, input_shape):
+    """Largest student config whose single-image latency fits the budget"""
+    chosen = None
+    for name, widths in STUDENT_CONFIGS.items():
+        student, _ = create_student_model(widths, input_shape)
+        latency = measure_latency(student)
+        fits = latency <= latency_budget_ms
+        print(f"   {name:<6} {student.count_params():>8,} params  {latency:6.2f} ms {'✅' if fits else '❌'}")
+        if fits:
+            chosen = name
+    if chosen is None:
+        chosen = next(iter(STUDENT_CONFIGS))
+        print(f"⚠️ No student fits {latency_budget_ms} ms - using the smallest ({chosen})")
+    return chosen
+
+
+def predict_scores(model, entries, data_path=DATASET_PATH):
+    """Stone probability of the first output head for every entry"""
+    size = tuple(model.inputs[0].shape[1:3])
+    outputs = model.predict(load_images(entries, size, data_path), verbose=0)
+    if isinstance(outputs, list):
+        outputs = outputs[0]
+    return outputs[:, 0]
+
+
+def evaluate(model, entries, data_path=DATASET_PATH):
+    labels = [1 if e['label'] == 'stone' else 0 for e in entries]
+    return float(roc_auc_score(labels, predict_scores(model, entries, data_path)))
+
+
+def distill(teacher_path, latency_budget_ms=5.0, data_path=DATASET_PATH, input_size=224,
+            output_path='kidney_stone_student.h5', report_path=REPORT_PATH):
+    teacher = tf.keras.models.load_model(teacher_path, compile=False)
+    input_shape = (input_size, input_size, 3)
+
+    print(f"⏱️  Student candidates at {input_size}px (budget {latency_budget_ms} ms/image):")
+    student_name = choose_student(latency_budget_ms, input_shape)
+    student, student_logits = create_student_model(STUDENT_CONFIGS[student_name], input_shape)
+    print(f"🎓 Training '{student_name}' student")
+
+    train_entries = split_entries('train', data_path)
+    val_entries = split_entries('val', data_path)
+    hard = np.array([1.0 if e['label'] == 'stone' else 0.0 for e in train_entries], dtype=np.float32)
+    soft = teacher_soft_targets(teacher, model_version(teacher_path), train_entries, data_path)
+    targets = np.stack([hard, soft], axis=1)
+
+    train_data = tf.data.Dataset.zip((
+        load_images(train_entries, input_shape[:2], data_path, batch_size=1).unbatch(),
+        tf.data.Dataset.from_tensor_slices(targets)
+    )).shuffle(2048).batch(DISTILL_CONFIG['batch_size']).prefetch(tf.data.AUTOTUNE)
+
+    student_logits.compile(
+        optimizer=tf.keras.optimizers.Adam(DISTILL_CONFIG['learning_rate']),
+        loss=distillation_loss()
+    )
+    student_logits.fit(
+        train_data,
+        epochs=DISTILL_CONFIG['epochs'],
+        callbacks=[tf.keras.callbacks.ReduceLROnPlateau(monitor='loss', factor=0.5, patience=3)],
+        verbose=1
+    )
+    # Save without optimizer state; the server only needs the probability head
+    student.save(output_path, include_optimizer=False)
+
+    test_entries = split_entries('test', data_path)
+    report = {'latency_budget_ms': latency_budget_ms, 'student_config': student_name}
+    for name, model, path in (('teacher', teacher, teacher_path), ('student', student, output_path)):
+        report[name] = {
+            'path': path,
+            'params': int(model.count_params()),
+            'file_mb': round(os.path.getsize(path) / 1e6, 2),
+            'val_auc': evaluate(model, val_entries, data_path),
+            'test_auc': evaluate(model, test_entries, data_path),
+            'latency_1_ms': measure_latency(model, 1),
+            'latency_32_ms': measure_latency(model, 32, repeats=10),
+        }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'':<14}{'teacher':>14}{'student':>14}")
+    for key, label in (('params', 'Parameters'), ('file_mb', 'File MB'), ('test_auc', 'Test AUC'),
+                       ('latency_1_ms', '1 image ms'), ('latency_32_ms', 'Batch 32 ms')):
+        t, s = report['teacher'][key], report['student'][key]
+        fmt = '{:>14,}' if key == 'params' else '{:>14.3f}'
+        print(f"{label:<14}{fmt.format(t)}{fmt.format(s)}")
+    print(f"💾 Student saved as: {output_path} (report: {report_path})")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distil a teacher .h5 into a tiny CPU student")
+    parser.add_argument('--teacher', default='kidney_stone_model.h5')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="single-image CPU latency budget")
+    parser.add_argument('--input-size', type=int, default=224)
+    parser.add_argument('--output', default='kidney_stone_student.h5')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.teacher):
+        print(f"❌ Teacher model not found: {args.teacher}")
+    else:
+        distill(args.teacher, args.latency_ms, input_size=args.input_size, output_path=args.output)
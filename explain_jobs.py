@@ -0,0 +1,162 @@
+"""
+Asynchronous explanation jobs for backend.py.
+
+Grad-CAM is far heavier than a prediction, so /explain/jobs only validates
+the upload and returns a job id; the explanation is computed on a dedicated
+thread pool (EXPLAIN_WORKERS, default 1) that is separate from the executor
+/predict's batcher uses, so a burst of explanations queues behind itself
+instead of starving predictions. Job status and results live in a small
+SQLite database (WAL mode), so finished explanations survive a restart and
+can be fetched by polling GET /explain/jobs/{id} or by subscribing to the
+server-sent event stream at GET /explain/jobs/{id}/events.
+
+    jobs = ExplainJobs()
+    job_id = jobs.submit(render_fn, img_array, original_img)
+    jobs.get(job_id)  # {'id', 'status', 'created', ..., 'result', 'error'}
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+EXPLAIN_JOBS_CONFIG = {
+    'db_path': os.environ.get('EXPLAIN_JOBS_DB', 'explain_jobs.db'),
+    'workers': int(os.environ.get('EXPLAIN_WORKERS', '1')),
+    'max_pending': 32,  # queued + running jobs; beyond this submissions are refused
+    'ttl_hours': 24,  # finished jobs older than this are deleted
+    'poll_interval': 0.25,  # seconds between status checks for event streams
+}
+
+FINISHED = ('done', 'failed')
+
+
+class JobStore:
+    """Job rows in SQLite, shared by the event loop and the worker threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL,
+            started REAL, finished REAL, result TEXT, error TEXT)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def create(self, job_id):
+        self._execute("INSERT INTO jobs (id, status, created) VALUES (?, 'queued', ?)", (job_id, time.time()))
+
+    def start(self, job_id):
+        self._execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id, result=None, error=None):
+        self._execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                      ('failed' if error else 'done', time.time(),
+                       None if result is None else json.dumps(result), error, job_id))
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def counts(self):
+        return {status: count for status, count in
+                self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+    def fail_unfinished(self, error):
+        """Mark jobs a previous process left queued or running as failed"""
+        self._execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? "
+                      "WHERE status NOT IN ('done', 'failed')", (time.time(), error))
+
+    def expire(self, max_age_s):
+        self._execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND created < ?",
+                      (time.time() - max_age_s,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ExplainJobs:
+    """Run explanation functions on a dedicated pool and record their results in a JobStore"""
+
+    def __init__(self, config=EXPLAIN_JOBS_CONFIG):
+        self.config = dict(config)
+        self.store = JobStore(self.config['db_path'])
+        self.store.fail_unfinished("server restarted before the job finished")
+        self.store.expire(self.config['ttl_hours'] * 3600)
+        self.pool = ThreadPoolExecutor(self.config['workers'], thread_name_prefix='explain')
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return its job id; fn must return something JSON-serialisable"""
+        with self._pending_lock:
+            if self.pending >= self.config['max_pending']:
+                raise QueueFull(f"{self.pending} explanations already pending")
+            self.pending += 1
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        self.pool.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        try:
+            self.store.start(job_id)
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.store.finish(job_id, error=str(e))
+            else:
+                self.store.finish(job_id, result=result)
+        finally:
+            with self._pending_lock:
+                self.pending -= 1
+
+    async def run(self, fn, *args):
+        """Await fn(*args) on the explanation pool without recording a job (synchronous /explain)"""
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    async def events(self, job_id):
+        """Server-sent event lines for each status change, ending when the job finishes"""
+        status = None
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'unknown job'})}\n\n"
+                return
+            if job['status'] != status:
+                status = job['status']
+                yield f"event: {status}\ndata: {json.dumps(job)}\n\n"
+            if status in FINISHED:
+                return
+            await asyncio.sleep(self.config['poll_interval'])
+
+    def describe(self):
+        return {'workers': self.config['workers'], 'pending': self.pending, 'jobs': self.store.counts()}
+
+    def close(self):
+        # Queued jobs are cancelled; a running one finishes before the store closes
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.store.fail_unfinished("server shut down before the job finished")
+        self.store.close()
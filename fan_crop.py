@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Ultrasound fan-region auto-crop.
+
+The scans carry black borders, scanner text, scale bars and calibration
+overlays around the imaging fan. fan_box() finds the fan from row and
+column intensity profiles of a downsampled frame: the longest run of rows
+with enough bright pixels, then the longest run of columns within those
+rows. Short separate runs (text lines, scale bars) lose to the fan.
+
+Training and serving share one switch: set FAN_CROP=1 to crop everywhere
+(flow_from_manifest, production_model.make_dataset, distill.load_images
+and backend.preprocess_image). Models trained without cropping must be
+served without it.
+
+Crop boxes for the dataset are cached per image md5 in fan_crop_boxes.json:
+
+    python3 fan_crop.py            # compute/cache boxes, report savings
+    python3 fan_crop.py --preview fan_crop_preview.png
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from dataset_index import DATASET_PATH, MANIFEST_PATH, load_manifest
+
+CROP_CACHE_PATH = "fan_crop_boxes.json"
+
+CROP_CONFIG = {
+    'enabled': os.environ.get('FAN_CROP', '0') == '1',
+    'threshold': 20,  # grey level separating content from background
+    'min_fraction': 0.08,  # a row/column is content if this fraction of it is above threshold
+    'max_gap': 0.03,  # gaps inside the fan bridged, as a fraction of the side
+    'margin': 0.01,  # padding around the box, fraction of the side
+    'min_area': 0.25,  # smaller boxes are treated as failures and the frame is kept
+    'profile_size': 128,  # px, side of the downsampled frame the profiles come from
+}
+
+
+def _longest_run(flags, max_gap):
+    """(first, last) index of the longest run of True allowing gaps up to max_gap, or None"""
+    idx = np.flatnonzero(flags)
+    if len(idx) == 0:
+        return None
+    breaks = np.flatnonzero(np.diff(idx) > max_gap + 1)
+    starts = idx[np.r_[0, breaks + 1]]
+    ends = idx[np.r_[breaks, len(idx) - 1]]
+    longest = np.argmax(ends - starts)
+    return int(starts[longest]), int(ends[longest])
+
+
+def fan_box(image, config=CROP_CONFIG):
+    """(left, top, right, bottom) of the imaging fan in a uint8 (H, W[, C]) array"""
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    full = (0, 0, width, height)
+    step = max(1, min(height, width) // config['profile_size'])
+    sample = image[::step, ::step]
+    if sample.ndim == 3:
+        sample = np.maximum(np.maximum(sample[..., 0], sample[..., 1]), sample[..., 2])
+    mask = sample > config['threshold']
+
+    rows = _longest_run(mask.mean(axis=1) > config['min_fraction'], config['max_gap'] * mask.shape[0])
+    if rows is None:
+        return full
+    cols = _longest_run(mask[rows[0]:rows[1] + 1].mean(axis=0) > config['min_fraction'],
+                        config['max_gap'] * mask.shape[1])
+    if cols is None:
+        return full
+
+    pad_y, pad_x = round(config['margin'] * height), round(config['margin'] * width)
+    left = max(0, cols[0] * step - pad_x)
+    top = max(0, rows[0] * step - pad_y)
+    right = min(width, (cols[1] + 1) * step + pad_x)
+    bottom = min(height, (rows[1] + 1) * step + pad_y)
+    if (right - left) * (bottom - top) < config['min_area'] * width * height:
+        return full
+    return left, top, right, bottom
+
+
+def crop_to_fan(image, config=CROP_CONFIG):
+    """PIL image cropped to its fan box"""
+    return image.crop(fan_box(np.asarray(image), config))
+
+
+def file_fan_box(path, config=CROP_CONFIG):
+    """Fan box of an image file in full-resolution pixels, from a reduced-scale decode"""
+    with Image.open(path) as image:
+        width, height = image.size
+        # JPEG decodes directly at 1/2, 1/4 or 1/8 scale
+        image.draft('L', (width // 4, height // 4))
+        small = np.asarray(image.convert('L'))
+    left, top, right, bottom = fan_box(small, config)
+    sx, sy = width / small.shape[1], height / small.shape[0]
+    return [round(left * sx), round(top * sy), min(width, round(right * sx)), min(height, round(bottom * sy))]
+
+
+def load_boxes(entries, dataset_path, cache_path=CROP_CACHE_PATH, workers=8):
+    """{md5: [left, top, right, bottom]} for manifest entries, computing and caching missing ones"""
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    missing = [e for e in entries if e['md5'] not in cache]
+    if missing:
+        with ThreadPoolExecutor(workers) as pool:
+            boxes = pool.map(file_fan_box, (os.path.join(dataset_path, e['path']) for e in missing))
+            cache.update(zip((e['md5'] for e in missing), boxes))
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+
+    return {e['md5']: cache[e['md5']] for e in entries}
+
+
+def entry_boxes(entries, dataset_path):
+    """(N, 4) int32 fan boxes aligned with entries, for tf.data pipelines"""
+    boxes = load_boxes(entries, dataset_path)
+    return np.array([boxes[e['md5']] for e in entries], dtype=np.int32).reshape(-1, 4)
+
+
+def _fan_crop_iterator_class():
+    # Keras is only needed for training; the backend imports this module for crop_to_fan
+    from tensorflow.keras.preprocessing.image import Iterator
+
+    class FanCropIterator(Iterator):
+        """Binary-label Keras iterator that crops every image to its fan box before resizing"""
+
+        def __init__(self, paths, classes, boxes, image_data_generator, class_indices,
+                     target_size=(224, 224), batch_size=32, shuffle=True, seed=None):
+            self.filepaths = list(paths)
+            self.classes = np.asarray(classes, dtype=np.int32)
+            self.boxes = np.asarray(boxes)
+            self.class_indices = dict(class_indices)
+            self.image_data_generator = image_data_generator
+            self.target_size = tuple(target_size)
+            self.dtype = image_data_generator.dtype
+            self.samples = len(self.filepaths)
+            super().__init__(self.samples, batch_size, shuffle, seed)
+
+        def _get_batches_of_transformed_samples(self, index_array):
+            batch_x = np.zeros((len(index_array), *self.target_size, 3), dtype=self.dtype)
+            for i, j in enumerate(index_array):
+                with Image.open(self.filepaths[j]) as image:
+                    image = image.convert('RGB').crop(tuple(self.boxes[j]))
+                    # Same nearest-neighbour resize as flow_from_dataframe
+                    x = np.asarray(image.resize(self.target_size[::-1], Image.NEAREST), dtype=self.dtype)
+                params = self.image_data_generator.get_random_transform(x.shape)
+                x = self.image_data_generator.apply_transform(x, params)
+                batch_x[i] = self.image_data_generator.standardize(x)
+            return batch_x, self.classes[index_array].astype(self.dtype)
+
+    return FanCropIterator
+
+
+def __getattr__(name):
+    """Build FanCropIterator on first use so importing fan_crop doesn't import TensorFlow"""
+    if name == 'FanCropIterator':
+        globals()[name] = _fan_crop_iterator_class()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def report(dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH, input_size=224, preview_path=None):
+    entries = load_manifest(dataset_path, manifest_path)
+    start = time.perf_counter()
+    boxes = load_boxes(entries, dataset_path)
+    elapsed = time.perf_counter() - start
+
+    areas = np.array([(b[2] - b[0]) * (b[3] - b[1]) / (e['width'] * e['height'])
+                      for e, b in ((e, boxes[e['md5']]) for e in entries)])
+    equivalent = input_size * np.sqrt(np.median(areas))
+    print(f"✂️  Fan boxes for {len(entries)} images ({elapsed:.1f}s, cached in {CROP_CACHE_PATH})")
+    print(f"   Crop keeps {np.median(areas):.0%} of the frame (median), {np.percentile(areas, 5):.0%} at p5")
+    print(f"   {(areas >= 0.999).mean():.1%} of images kept uncropped")
+    print(f"   A {equivalent:.0f}px cropped input has the fan detail of a {input_size}px uncropped one")
+
+    if preview_path:
+        picks = entries[::max(1, len(entries) // 8)][:8]
+        canvas = Image.new('RGB', (4 * 256, 2 * 256))
+        for i, e in enumerate(picks):
+            with Image.open(os.path.join(dataset_path, e['path'])) as image:
+                tile = image.convert('RGB').crop(boxes[e['md5']]).resize((256, 256))
+            canvas.paste(tile, ((i % 4) * 256, (i // 4) * 256))
+        canvas.save(preview_path)
+        print(f"🖼️  Preview saved to: {preview_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache ultrasound fan crop boxes for the dataset")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--preview', default=None, help="save a grid of cropped samples")
+    args = parser.parse_args()
+    report(args.dataset, args.manifest, preview_path=args.preview)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Opt-in fast training mode: bfloat16 mixed precision + XLA compilation.
+
+Trainers call enable_fast_training() before building their model and pass
+the returned kwargs to model.compile(). Output layers are declared with
+dtype='float32' so sigmoid/softmax scores stay in full precision either way.
+
+Every fit() run logs its step times and final metrics through StepTimeLogger,
+so fast and float32 runs of the same model can be compared:
+
+    python3 train_real_model.py           # float32 baseline
+    python3 train_real_model.py --fast    # bfloat16 + XLA
+    python3 fast_training.py              # compare the two
+"""
+
+import json
+import os
+import statistics
+import time
+
+import tensorflow as tf
+
+LOG_PATH = "fast_training_log.jsonl"
+FAST_POLICY = 'mixed_bfloat16'
+
+# Steps excluded from timing while XLA compiles / the input pipeline warms up
+WARMUP_STEPS = 5
+
+
+def enable_fast_training(enabled=True):
+    """Set the global dtype policy and return extra model.compile() kwargs"""
+    if not enabled:
+        tf.keras.mixed_precision.set_global_policy('float32')
+        return {}
+    tf.keras.mixed_precision.set_global_policy(FAST_POLICY)
+    print(f"⚡ Fast training: {FAST_POLICY} policy + XLA jit_compile")
+    return {'jit_compile': True}
+
+
+class StepTimeLogger(tf.keras.callbacks.Callback):
+    """Record per-step wall time and final metrics of one fit() run"""
+
+    def __init__(self, model_name, phase='train', fast=False, log_path=LOG_PATH):
+        super().__init__()
+        self.model_name = model_name
+        self.phase = phase
+        self.fast = fast
+        self.log_path = log_path
+        self.step_times = []
+        self.last_logs = {}
+
+    def on_train_begin(self, logs=None):
+        self.step_times = []
+        self.train_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step_times.append(time.perf_counter() - self.step_start)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.last_logs = dict(logs or {})
+
+    def on_train_end(self, logs=None):
+        timed = self.step_times[WARMUP_STEPS:] or self.step_times
+        record = {
+            'model': self.model_name,
+            'phase': self.phase,
+            'mode': 'fast' if self.fast else 'float32',
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'steps': len(self.step_times),
+            'first_step_ms': round(self.step_times[0] * 1000, 2) if self.step_times else None,
+            'median_step_ms': round(statistics.median(timed) * 1000, 2) if timed else None,
+            'mean_step_ms': round(statistics.mean(timed) * 1000, 2) if timed else None,
+            'total_s': round(time.perf_counter() - self.train_start, 1),
+            'final_metrics': {k: float(v) for k, v in self.last_logs.items()},
+        }
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        print(f"⏱️  {self.model_name} [{self.phase}, {record['mode']}]: "
+              f"median step {record['median_step_ms']} ms over {record['steps']} steps")
+
+
+def compare_runs(log_path=LOG_PATH):
+    """Print the latest fast vs float32 run for every (model, phase) pair"""
+    if not os.path.exists(log_path):
+        print(f"❌ No timing log found: {log_path}")
+        return
+
+    latest = {}
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            latest[(record['model'], record['phase'], record['mode'])] = record
+
+    pairs = sorted({(model, phase) for model, phase, _ in latest})
+    for model, phase in pairs:
+        base = latest.get((model, phase, 'float32'))
+        fast = latest.get((model, phase, 'fast'))
+        print(f"\n📊 {model} [{phase}]")
+        if not (base and fast):
+            print("   Need both a float32 and a --fast run to compare")
+            continue
+
+        speedup = base['median_step_ms'] / fast['median_step_ms'] if fast['median_step_ms'] else 0
+        print(f"   Median step: {base['median_step_ms']} ms → {fast['median_step_ms']} ms ({speedup:.2f}x)")
+        print(f"   Wall clock:  {base['total_s']} s → {fast['total_s']} s")
+        for metric, base_value in sorted(base['final_metrics'].items()):
+            if metric in fast['final_metrics'] and metric != 'lr':
+                fast_value = fast['final_metrics'][metric]
+                print(f"   {metric}: {base_value:.4f} → {fast_value:.4f} ({fast_value - base_value:+.4f})")
+
+
+if __name__ == "__main__":
+    compare_runs()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Class-activation maps for the kidney stone models.
+
+Two ways to get a coarse (e.g. 7x7) map of where the stone evidence is:
+
+- cam: gradient-free. Every architecture here ends in global pooling
+  (GAP, or GAP+GMP) over the last conv feature map followed by dense
+  layers. One forward pass returns the feature map together with the
+  normal outputs, and the head is then evaluated at each location as if
+  that location's feature vector were the whole image, giving a map of
+  stone logits. For a linear head this is exactly CAM (the map averages
+  to the model's logit); for the MLP heads it is the head's local
+  evidence, signed. Costs a prediction plus one small dense batch.
+- gradcam: Grad-CAM, weighting the feature map channels by the mean
+  gradient of the stone score. Works for any head. The gradient is only
+  taken back to the feature map, so the backward pass covers just the
+  head; the tape still keeps the forward activations alive.
+
+On CPU with EfficientNetB0 (7x7x1280 map) both run in about the time of a
+plain prediction (~35 ms).
+
+    explainer = GradCAM(model)
+    cam, method, score = explainer.explain(batch)  # method: auto | cam | gradcam
+
+Compare the two on dataset images:
+
+    python3 gradcam.py --model kidney_stone_model.h5 --sample 16
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import DATASET_PATH
+from serving import EXPLAIN_METHODS as METHODS, ModelSpec
+
+CAM_CONFIG = {
+    'method': os.environ.get('EXPLAIN_METHOD', 'auto'),  # auto (cam when the head allows it) | cam | gradcam
+}
+
+_POOLING = (tf.keras.layers.GlobalAveragePooling2D, tf.keras.layers.GlobalMaxPooling2D)
+
+
+def _rank(tensor):
+    return len(tensor.shape)
+
+
+def _inputs(layer):
+    """The layer's input tensors in the outermost graph it was called in"""
+    inputs = layer.get_input_at(-1)
+    return inputs if isinstance(inputs, (list, tuple)) else [inputs]
+
+
+def feature_layer(model):
+    """Last layer producing a spatial (batch, h, w, c) map with more than one location"""
+    for layer in reversed(model.layers):
+        shape = layer.get_output_at(-1).shape
+        if len(shape) == 4 and (shape[1] or 0) * (shape[2] or 0) > 1:
+            return layer
+    raise ValueError("Model has no spatial feature map to explain")
+
+
+def head_poolings(model, features):
+    """Global pooling layers over the feature map, or None if anything after it sees the map otherwise"""
+    poolings = []
+    for layer in model.layers[model.layers.index(features) + 1:]:
+        if any(_rank(tensor) == 4 for tensor in _inputs(layer)):
+            if not isinstance(layer, _POOLING):
+                return None
+            poolings.append(layer)
+    return poolings or None
+
+
+class GradCAM:
+    """Gradient-free CAM and Grad-CAM maps for the primary output of a Keras model"""
+
+    def __init__(self, model, config=CAM_CONFIG):
+        self.config = dict(config)
+        self.spec = ModelSpec(model)
+        self.features = feature_layer(model)
+        output_layer = model.get_layer(self.spec.primary_output)
+        # One forward pass yields the feature map alongside the stone score
+        self._model = tf.keras.Model(model.inputs, [self.features.get_output_at(-1), output_layer.get_output_at(-1)])
+        self._forward = tf.function(lambda x: self._model(x, training=False), reduce_retracing=True)
+        self._gradcam = tf.function(self._gradcam_graph, reduce_retracing=True)
+        self._head = self._build_head(model, output_layer)
+        self.supports_cam = self._head is not None
+
+    def _build_head(self, model, output_layer):
+        """Per-location stone logit function, or None if the head is not pooling + dense layers"""
+        poolings = head_poolings(model, self.features)
+        if poolings is None:
+            return None
+        if isinstance(output_layer, tf.keras.layers.Dense):
+            kernel = output_layer.kernel[:, 0]
+            bias = output_layer.bias[0] if output_layer.use_bias else 0.0
+            logit = lambda x: tf.linalg.matvec(tf.cast(x, kernel.dtype), kernel) + bias
+        elif isinstance(output_layer, tf.keras.layers.Activation):
+            logit = lambda x: tf.cast(x[:, 0], tf.float32)
+        else:
+            return None
+        pooled = [layer.get_output_at(-1) for layer in poolings]
+        penultimate = _inputs(output_layer)[0]
+        if len(pooled) == 1 and penultimate is pooled[0]:
+            # Output layer straight on the pooled features: classic CAM
+            head = lambda inputs, training: inputs[0]
+        else:
+            try:
+                # From the pooled vectors to the primary output's input; fails if the head reads anything else
+                head = tf.keras.Model(pooled, penultimate)
+            except ValueError:
+                return None
+        # GAP and GMP of a single location are that location's feature vector
+        return tf.function(lambda x: logit(head([x] * len(poolings), training=False)), reduce_retracing=True)
+
+    def resolve(self, method=None):
+        method = method or self.config['method']
+        if method not in METHODS:
+            raise ValueError(f"Unknown explanation method {method!r}, expected one of {', '.join(METHODS)}")
+        if method == 'auto':
+            return 'cam' if self.supports_cam else 'gradcam'
+        if method == 'cam' and not self.supports_cam:
+            raise ValueError("Gradient-free CAM needs a global-pooling head; use method=gradcam")
+        return method
+
+    def generate_cam(self, img_array):
+        """(cam (h, w), stone score) from one forward pass and the head applied per location"""
+        feature_map, score = self._forward(tf.convert_to_tensor(img_array, tf.float32))
+        _, height, width, channels = feature_map.shape
+        cam = self._head(tf.reshape(feature_map[0], (height * width, channels)))
+        return np.reshape(cam.numpy(), (height, width)), float(score[0, 0])
+
+    def generate_gradcam(self, img_array):
+        """Grad-CAM map (h, w) for the stone score"""
+        return self.gradcam_with_score(img_array)[0]
+
+    def _gradcam_graph(self, inputs):
+        with tf.GradientTape() as tape:
+            feature_map, score = self._model(inputs, training=False)
+            target = score[:, 0]
+        grads = tf.cast(tape.gradient(target, feature_map), tf.float32)
+        weights = tf.reduce_mean(grads, axis=(1, 2))
+        cam = tf.nn.relu(tf.einsum('bhwc,bc->bhw', tf.cast(feature_map, tf.float32), weights))
+        return cam[0], score[0, 0]
+
+    def gradcam_with_score(self, img_array):
+        cam, score = self._gradcam(tf.convert_to_tensor(img_array, tf.float32))
+        return cam.numpy(), float(score)
+
+    def explain(self, img_array, method=None):
+        """(cam, method used, stone score)"""
+        method = self.resolve(method)
+        if method == 'cam':
+            cam, score = self.generate_cam(img_array)
+        else:
+            cam, score = self.gradcam_with_score(img_array)
+        return cam, method, score
+
+    def describe(self):
+        return {
+            'feature_layer': self.features.name,
+            'feature_map': list(self.features.get_output_at(-1).shape[1:]),
+            'supports_cam': self.supports_cam,
+            'default_method': self.resolve(),
+        }
+
+
+def compare(model_path, dataset_path=DATASET_PATH, sample=16):
+    # PIL and load_test are only needed for the comparison
+    import io
+    from PIL import Image
+    from load_test import load_images
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    explainer = GradCAM(model)
+    print(f"🔍 {model_path}: {explainer.describe()}")
+    if not explainer.supports_cam:
+        print("⚠️ Head is not global pooling + dense; only Grad-CAM is available")
+        return
+
+    arrays = [np.asarray(Image.open(io.BytesIO(data)).convert('RGB').resize(explainer.spec.input_size),
+                         dtype=np.float32)[None] / 255.0
+              for _, data in load_images(dataset_path, sample)]
+    timings = {'predict': [], 'cam': [], 'gradcam': []}
+    correlations = []
+    for array in [arrays[0]] + arrays:  # first call traces the graphs
+        start = time.perf_counter()
+        explainer.spec.predict(array)
+        predicted = time.perf_counter()
+        cam, _ = explainer.generate_cam(array)
+        cammed = time.perf_counter()
+        grad = explainer.generate_gradcam(array)
+        done = time.perf_counter()
+        timings['predict'].append(predicted - start)
+        timings['cam'].append(cammed - predicted)
+        timings['gradcam'].append(done - cammed)
+        if grad.std() > 0 and cam.std() > 0:
+            correlations.append(np.corrcoef(cam.ravel(), grad.ravel())[0, 1])
+
+    for name, values in timings.items():
+        print(f"   {name:<8} median {np.median(values[1:]) * 1000:7.1f} ms")
+    if correlations:
+        print(f"   CAM vs Grad-CAM map correlation: median {np.median(correlations):.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare gradient-free CAM with Grad-CAM")
+    parser.add_argument('--model', default='kidney_stone_model.h5')
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--sample', type=int, default=16)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}")
+    else:
+        compare(args.model, args.dataset, args.sample)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Heatmap rendering for /explain.
+
+Class-activation maps come out of the network at 7x7 or so. The renderer
+normalises the map to uint8 while it is still small, upsamples the uint8
+map straight to the output size, colours it through a precomputed 256-entry
+JET lookup table and blends it into the scan with a uint8 weighted add, so
+nothing at output resolution is ever float. Output size is configurable
+independently of the uploaded image (HEATMAP_SIZE, longest side), and
+encoding (the dominant cost) can switch from PNG to JPEG.
+
+Modes:
+- overlay: JET heatmap blended into the scan (the classic Grad-CAM picture)
+- contour: the scan with outlines of the high-activation regions
+- boxes: the scan with boxes around the top-k activation regions
+
+Images are RGB uint8 arrays, as produced by backend.preprocess_image.
+
+Compare against the previous cv2 float path on dataset images:
+
+    python3 heatmap_render.py --sample 32
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from dataset_index import DATASET_PATH
+
+HEATMAP_CONFIG = {
+    'output_size': int(os.environ.get('HEATMAP_SIZE', '224')),  # px, longest side; 0 keeps the image size
+    'mode': 'overlay',  # overlay | contour | boxes
+    'alpha': 0.4,  # heatmap weight in overlay mode
+    'level': 0.5,  # activation threshold (0-1) for contour and boxes
+    'top_k': 3,  # boxes drawn in boxes mode
+    'format': os.environ.get('HEATMAP_FORMAT', 'png'),  # png | jpeg (~20x faster to encode, lossy)
+    'jpeg_quality': 90,
+}
+
+MODES = ('overlay', 'contour', 'boxes')
+
+# JET colours in RGB order, indexed by activation 0-255; shaped (256, 1, 3) for cv2.applyColorMap
+JET_LUT = np.ascontiguousarray(
+    cv2.applyColorMap(np.arange(256, dtype=np.uint8)[:, None], cv2.COLORMAP_JET)[..., ::-1])
+
+OUTLINE_COLOUR = (255, 64, 0)
+
+
+def output_shape(image_shape, output_size):
+    """(width, height) with the longest side scaled to output_size"""
+    height, width = image_shape[:2]
+    if not output_size:
+        return width, height
+    scale = output_size / max(height, width)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def cam_to_uint8(cam, size):
+    """Min-max normalise a small activation map to uint8, then upsample it to (width, height)"""
+    cam = np.asarray(cam, dtype=np.float32)
+    low, high = float(cam.min()), float(cam.max())
+    scaled = (cam - low) * (255.0 / (high - low)) if high > low else np.zeros_like(cam)
+    return cv2.resize(scaled.astype(np.uint8), size, interpolation=cv2.INTER_LINEAR)
+
+
+def colourise(heat):
+    """(H, W, 3) RGB JET colours for a uint8 activation map"""
+    # A table lookup through OpenCV; NumPy fancy indexing is ~10x slower
+    return cv2.applyColorMap(heat, JET_LUT)
+
+
+def region_boxes(heat, level, top_k):
+    """[(x, y, w, h, mean activation)] of the top_k connected regions above level, by total activation"""
+    mask = (heat >= int(level * 255)).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return []
+    mass = np.bincount(labels.ravel(), weights=heat.ravel(), minlength=count)
+    mass[0] = 0  # background
+    order = np.argsort(-mass)[:min(top_k, count - 1)]
+    return [(*(int(v) for v in stats[i, :4]), int(mass[i] / stats[i, cv2.CC_STAT_AREA])) for i in order]
+
+
+def render(image, cam, mode=None, output_size=None, config=HEATMAP_CONFIG):
+    """RGB uint8 rendering of an activation map over an RGB uint8 image"""
+    mode = mode or config['mode']
+    if mode not in MODES:
+        raise ValueError(f"Unknown heatmap mode {mode!r}, expected one of {', '.join(MODES)}")
+    size = output_shape(image.shape, config['output_size'] if output_size is None else output_size)
+    if size != (image.shape[1], image.shape[0]):
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    heat = cam_to_uint8(cam, size)
+
+    if mode == 'overlay':
+        # uint8 in and out; OpenCV's SIMD blend beats a NumPy fixed-point version several times over
+        return cv2.addWeighted(image, 1 - config['alpha'], colourise(heat), config['alpha'], 0)
+
+    canvas = image.copy()
+    thickness = max(1, round(max(size) / 224))
+    if mode == 'contour':
+        mask = (heat >= int(config['level'] * 255)).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(canvas, contours, -1, OUTLINE_COLOUR, thickness)
+    else:
+        for x, y, w, h, mean in region_boxes(heat, config['level'], config['top_k']):
+            colour = tuple(int(c) for c in JET_LUT[mean, 0])
+            cv2.rectangle(canvas, (x, y), (x + w - 1, y + h - 1), colour, thickness)
+    return canvas
+
+
+def encode(image, config=HEATMAP_CONFIG):
+    """(mime type, bytes) of an RGB uint8 image in the configured format"""
+    bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    if config['format'] == 'jpeg':
+        ok, buffer = cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, config['jpeg_quality']])
+        mime = 'image/jpeg'
+    else:
+        ok, buffer = cv2.imencode('.png', bgr)
+        mime = 'image/png'
+    if not ok:
+        raise ValueError(f"{config['format']} encoding failed")
+    return mime, buffer.tobytes()
+
+
+def legacy_render(image, cam):
+    """The previous /explain path: float resize, colormap and addWeighted at image size"""
+    heatmap = cv2.resize(np.asarray(cam, dtype=np.float64), (image.shape[1], image.shape[0]))
+    heatmap = cv2.applyColorMap(np.uint8(255 * heatmap), cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(image, 0.6, heatmap, 0.4, 0)
+    return cv2.imencode('.png', overlay)[1]
+
+
+def benchmark(dataset_path=DATASET_PATH, sample=32, repeats=5):
+    # load_test reads image files only; no network involved
+    from load_test import load_images
+
+    images = []
+    for _, data in load_images(dataset_path, sample):
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        images.append(np.ascontiguousarray(decoded[..., ::-1]))
+    rng = np.random.default_rng(0)
+    cams = [rng.random((7, 7)).astype(np.float32) for _ in images]
+    print(f"🎨 {len(images)} images, median size {int(np.median([i.shape[1] for i in images]))}px wide")
+
+    def timed(fn):
+        timings = []
+        for _ in range(repeats):
+            for image, cam in zip(images, cams):
+                start = time.perf_counter()
+                fn(image, cam)
+                timings.append(time.perf_counter() - start)
+        return np.median(timings) * 1000
+
+    print(f"{'path':<32}{'median ms':>10}{'KB':>9}")
+    baseline = timed(legacy_render)
+    size = np.median([len(legacy_render(i, c)) for i, c in zip(images, cams)]) / 1024
+    print(f"{'legacy (image size)':<32}{baseline:>10.3f}{size:>9.1f}")
+    for image_format in ('png', 'jpeg'):
+        config = {**HEATMAP_CONFIG, 'format': image_format}
+        for output_size in (224, 512, 0):
+            for mode in MODES:
+                def run(image, cam):
+                    return encode(render(image, cam, mode, output_size, config), config)[1]
+                ms = timed(run)
+                size = np.median([len(run(i, c)) for i, c in zip(images, cams)]) / 1024
+                label = f"{mode} @ {output_size or 'image size'} {image_format}"
+                print(f"{label:<32}{ms:>10.3f}{size:>9.1f}  ({baseline / ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark heatmap rendering against the previous path")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--sample', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.dataset, args.sample, args.repeats)
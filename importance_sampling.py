@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Loss-aware importance sampling for the Keras training loops.
+
+Uniform epochs keep revisiting scans the model already gets right.
+ImportanceSampler wraps a training iterator, such as flow_from_manifest's,
+and draws each epoch's batches with probability proportional to a running
+(exponentially smoothed) per-example loss. That distribution is mixed with
+uniform so that no example is starved.
+
+Every example carries an importance weight 1 / (n * p). Weighting the loss
+this way keeps it an unbiased estimate of the uniform-epoch loss, and the
+uniform share bounds the weight at 1 / uniform_mix. Per-example losses come
+from each step's own forward pass, so tracking them costs no extra
+inference. attach() gives the model a train_step that reads the example
+rows and weights carried with each batch.
+
+Enable it in the trainers with IMPORTANCE_SAMPLING=1, or in code:
+
+    train_data = importance_sampling(train_generator, model)  # after compile
+    model.fit(train_data, ...)
+
+Compare time-to-target validation AUC against uniform sampling:
+
+    python3 importance_sampling.py --target-auc 0.90 --epochs 20
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import DATASET_PATH, MANIFEST_PATH
+
+REPORT_PATH = "importance_sampling_report.json"
+
+IMPORTANCE_CONFIG = {
+    'enabled': os.environ.get('IMPORTANCE_SAMPLING', '0') == '1',
+    'uniform_mix': 0.3,  # share of the sampling distribution kept uniform; caps weights at 1 / uniform_mix
+    'momentum': 0.5,  # smoothing of each example's running loss across visits
+    'warmup_epochs': 1,  # plain uniform epochs before any losses are known
+    'seed': 42,
+}
+
+
+class ImportanceSampler(tf.keras.utils.Sequence):
+    """Keras Sequence drawing an iterator's examples in proportion to their running loss"""
+
+    def __init__(self, iterator, config=IMPORTANCE_CONFIG):
+        super().__init__()
+        self.iterator = iterator
+        self.config = dict(config)
+        self.batch_size = iterator.batch_size
+        self.samples = iterator.n
+        self.epoch = 0
+        # Unseen examples start at the loss of an uninformed 0.5 prediction
+        self.running_loss = tf.Variable(tf.fill([self.samples], math.log(2.0)), trainable=False)
+        self.seen = tf.Variable(tf.zeros([self.samples], tf.bool), trainable=False)
+        self._rng = np.random.default_rng(self.config['seed'])
+        self._plan()
+
+    def __len__(self):
+        return math.ceil(self.samples / self.batch_size)
+
+    def __getattr__(self, name):
+        # classes, class_indices, etc. of the wrapped iterator
+        return getattr(self.iterator, name)
+
+    def probabilities(self):
+        losses = np.maximum(self.running_loss.numpy().astype(np.float64), 1e-8)
+        mix = self.config['uniform_mix']
+        return (1 - mix) * losses / losses.sum() + mix / self.samples
+
+    def _plan(self):
+        """Rows and importance weights for every batch of the coming epoch"""
+        if self.epoch < self.config['warmup_epochs']:
+            self._rows = self._rng.permutation(self.samples)
+            self._weights = np.ones(self.samples, dtype=np.float32)
+            return
+        p = self.probabilities()
+        self._rows = self._rng.choice(self.samples, size=len(self) * self.batch_size, p=p)
+        self._weights = (1.0 / (self.samples * p[self._rows])).astype(np.float32)
+
+    def __getitem__(self, index):
+        batch = slice(index * self.batch_size, (index + 1) * self.batch_size)
+        rows = self._rows[batch]
+        x, y = self.iterator._get_batches_of_transformed_samples(rows)
+        # Weight and row travel as the sample_weight column pair; attach()'s train_step splits them
+        return x, y, np.stack([self._weights[batch], rows.astype(np.float32)], axis=1)
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        self._plan()
+
+    def record(self, rows, losses):
+        """Fold one step's per-example losses into the running losses (in-graph)"""
+        losses = tf.cast(losses, tf.float32)
+        momentum = self.config['momentum']
+        smoothed = tf.where(tf.gather(self.seen, rows),
+                            momentum * tf.gather(self.running_loss, rows) + (1 - momentum) * losses, losses)
+        self.running_loss.scatter_nd_update(rows[:, None], smoothed)
+        self.seen.scatter_nd_update(rows[:, None], tf.ones_like(rows, tf.bool))
+
+    def attach(self, model):
+        """Give model a train_step that applies the importance weights and records per-example losses"""
+        default_step = model.train_step
+        per_example_loss = tf.keras.losses.get(model.loss)
+
+        def train_step(data):
+            x, y, packed = tf.keras.utils.unpack_x_y_sample_weight(data)
+            if packed is None or len(packed.shape) != 2:
+                return default_step(data)
+            weights, rows = packed[:, 0], tf.cast(packed[:, 1], tf.int32)
+            with tf.GradientTape() as tape:
+                y_pred = model(x, training=True)
+                loss = model.compute_loss(x, y, y_pred, weights)
+            model.optimizer.minimize(loss, model.trainable_variables, tape=tape)
+            # Unweighted loss of this forward pass, per example
+            labels = tf.reshape(tf.cast(y, y_pred.dtype), tf.shape(y_pred))
+            self.record(rows, tf.stop_gradient(per_example_loss(labels, y_pred)))
+            return model.compute_metrics(x, y, y_pred, weights)
+
+        # Survives recompiling (e.g. for fine-tuning) and isn't part of the saved model
+        model.train_step = train_step
+        return self
+
+    def get_state(self):
+        """Epoch, RNG and running losses, saved with AsyncCheckpoint so a resumed run keeps sampling by loss"""
+        return {'epoch': self.epoch, 'rng': self._rng.bit_generator.state,
+                'running_loss': self.running_loss.numpy(), 'seen': self.seen.numpy()}
+
+    def set_state(self, state):
+        """Restore get_state(); the epoch's plan is redrawn at the next on_epoch_end()"""
+        self.epoch = state['epoch']
+        self._rng.bit_generator.state = state['rng']
+        self.running_loss.assign(state['running_loss'])
+        self.seen.assign(state['seen'])
+
+    def describe(self):
+        p = self.probabilities()
+        return {'epoch': self.epoch, 'seen': int(self.seen.numpy().sum()), 'samples': self.samples,
+                'max_weight': float(1.0 / (self.samples * p.min())), 'min_weight': float(1.0 / (self.samples * p.max()))}
+
+
+def importance_sampling(iterator, model, config=IMPORTANCE_CONFIG):
+    """Training data for model.fit: loss-weighted sampling of iterator when enabled, else iterator itself"""
+    if not config['enabled']:
+        return iterator
+    print(f"🎯 Importance sampling: {iterator.n} examples, {config['uniform_mix']:.0%} uniform")
+    return ImportanceSampler(iterator, config).attach(model)
+
+
+class TimeToTarget(tf.keras.callbacks.Callback):
+    """Wall time and epoch at which validation AUC first reaches a target"""
+
+    def __init__(self, target_auc, stop=True, monitor='val_auc'):
+        super().__init__()
+        self.target_auc = target_auc
+        self.stop = stop
+        self.monitor = monitor
+        self.history = []
+        self.reached = None
+
+    def on_train_begin(self, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._start
+        auc = float(logs[self.monitor])
+        self.history.append({'epoch': epoch + 1, 'seconds': round(elapsed, 1), 'val_auc': round(auc, 4)})
+        if self.reached is None and auc >= self.target_auc:
+            self.reached = {'epoch': epoch + 1, 'seconds': round(elapsed, 1)}
+            if self.stop:
+                self.model.stop_training = True
+
+
+def compare(target_auc=0.9, epochs=20, model_name='small', image_size=128, batch_size=32,
+            dataset_path=DATASET_PATH, manifest_path=MANIFEST_PATH, report_path=REPORT_PATH):
+    """Train the same student with uniform and importance sampling; time each to the target AUC"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    from dataset_index import flow_from_manifest
+    from distill import STUDENT_CONFIGS, create_student_model
+
+    datagen = ImageDataGenerator(rescale=1./255)
+    val_data = flow_from_manifest(datagen, 'val', dataset_path=dataset_path, manifest_path=manifest_path,
+                                  target_size=(image_size, image_size), batch_size=batch_size)
+    runs = {}
+    for sampling in ('uniform', 'importance'):
+        tf.keras.utils.set_random_seed(IMPORTANCE_CONFIG['seed'])
+        train_generator = flow_from_manifest(datagen, 'train', dataset_path=dataset_path, manifest_path=manifest_path,
+                                             target_size=(image_size, image_size), batch_size=batch_size,
+                                             seed=IMPORTANCE_CONFIG['seed'])
+        model, _ = create_student_model(STUDENT_CONFIGS[model_name], (image_size, image_size, 3))
+        model.compile(optimizer=tf.keras.optimizers.Adam(2e-3), loss='binary_crossentropy',
+                      metrics=[tf.keras.metrics.AUC(name='auc')])
+        train_data = importance_sampling(train_generator, model, {**IMPORTANCE_CONFIG, 'enabled': sampling == 'importance'})
+        timer = TimeToTarget(target_auc)
+        print(f"\n🏃 {sampling} sampling")
+        model.fit(train_data, validation_data=val_data, epochs=epochs, callbacks=[timer], verbose=2)
+        runs[sampling] = {
+            'reached': timer.reached,
+            'best_val_auc': max(h['val_auc'] for h in timer.history),
+            'history': timer.history,
+        }
+
+    report = {'target_auc': target_auc, 'model': model_name, 'image_size': image_size,
+              'config': IMPORTANCE_CONFIG, 'runs': runs}
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'sampling':<12}{'epochs':>8}{'seconds':>9}{'best AUC':>10}   (to val AUC {target_auc})")
+    for sampling, run in runs.items():
+        reached = run['reached']
+        epochs_to, seconds_to = (reached['epoch'], f"{reached['seconds']:.0f}") if reached else ('-', '-')
+        print(f"{sampling:<12}{epochs_to:>8}{seconds_to:>9}{run['best_val_auc']:>10.3f}")
+    if runs['uniform']['reached'] and runs['importance']['reached']:
+        speedup = runs['uniform']['reached']['seconds'] / runs['importance']['reached']['seconds']
+        print(f"⏱️  Importance sampling reached the target {speedup:.2f}x as fast")
+    print(f"💾 Report saved as: {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-to-target AUC: uniform vs importance sampling")
+    parser.add_argument('--target-auc', type=float, default=0.9)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--model', default='small', help="distill.py student config: nano|tiny|small|base")
+    parser.add_argument('--image-size', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--manifest', default=MANIFEST_PATH)
+    parser.add_argument('--report', default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        print(f"❌ Dataset not found: {args.dataset}")
+    else:
+        compare(args.target_auc, args.epochs, args.model, args.image_size, args.batch_size,
+                args.dataset, args.manifest, args.report)
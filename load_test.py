@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for backend.py and simple_backend.py.
+
+Replays dataset images against /predict and/or /explain with plain asyncio
+sockets (no client dependency), in one of two modes:
+
+- closed loop: a fixed number of concurrent clients, each sending its next
+  request as soon as the previous one returns (measures capacity)
+- open loop: requests start at a fixed arrival rate whether or not earlier
+  ones finished; latency is measured from the scheduled start so a slow
+  server can't hide queueing delay (measures behaviour under a given load)
+
+Results (throughput, p50/p95/p99 latency, error rate per endpoint) can be
+saved as a JSON baseline and compared with a previous one; a regression
+makes the process exit with status 1.
+
+Usage:
+    python3 load_test.py --url http://localhost:8000 --mode closed --concurrency 8 --duration 30
+    python3 load_test.py --mode open --rate 20 --save-baseline benchmarks/backend_open.json
+    python3 load_test.py --mode open --rate 20 --compare benchmarks/backend_open.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from dataset_index import DATASET_PATH
+
+REGRESSION_TOLERANCE = {
+    'p95_ms': 0.15,  # relative increase
+    'p99_ms': 0.25,
+    'throughput': 0.10,  # relative decrease
+    'error_rate': 0.01,  # absolute increase
+}
+
+
+def load_images(dataset_path=DATASET_PATH, limit=100, seed=0):
+    """(filename, bytes) for a fixed random sample of dataset images"""
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(dataset_path)
+                   for name in names if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    random.Random(seed).shuffle(paths)
+    images = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def multipart_body(filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+async def post(url, path, filename, data, timeout):
+    """One POST on a fresh connection; returns (status, response size)"""
+    parts = urlsplit(url)
+    content_type, body = multipart_body(filename, data)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, parts.port or 80), timeout)
+    try:
+        writer.write((f'POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode() + body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+    return status, len(response)
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []  # (endpoint, latency_s, ok, finished_at)
+
+    async def request(self, url, endpoint, image, timeout, scheduled=None):
+        start = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            status, _ = await post(url, endpoint, *image, timeout)
+            ok = 200 <= status < 300
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            ok = False
+        end = time.perf_counter()
+        self.results.append((endpoint, end - start, ok, end))
+
+
+async def closed_loop(url, endpoints, images, concurrency, duration, timeout):
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    counter = iter(range(sys.maxsize))
+
+    async def client():
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            await recorder.request(url, endpoints[i % len(endpoints)], images[i % len(images)], timeout)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return recorder.results, time.perf_counter() - start
+
+
+async def open_loop(url, endpoints, images, rate, duration, timeout, poisson=False, seed=0):
+    recorder = Recorder()
+    rng = random.Random(seed)
+    tasks = []
+    start = time.perf_counter()
+    scheduled = start
+    i = 0
+    while scheduled < start + duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(recorder.request(
+            url, endpoints[i % len(endpoints)], images[i % len(images)], timeout, scheduled=scheduled)))
+        i += 1
+        scheduled += rng.expovariate(rate) if poisson else 1 / rate
+    await asyncio.gather(*tasks)
+    return recorder.results, time.perf_counter() - start
+
+
+def summarise(results, elapsed):
+    """Per-endpoint and overall throughput, latency percentiles and error rate"""
+    summary = {}
+    for endpoint in sorted({r[0] for r in results}) + ['all']:
+        rows = [r for r in results if endpoint in ('all', r[0])]
+        latencies = np.array([r[1] for r in rows if r[2]]) * 1000
+        errors = sum(1 for r in rows if not r[2])
+        summary[endpoint] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+            'throughput': round((len(rows) - errors) / elapsed, 2),
+            **{f'p{q}_ms': round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+               for q in (50, 95, 99)},
+            'mean_ms': round(float(latencies.mean()), 2) if len(latencies) else None,
+        }
+    return summary
+
+
+def find_regressions(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Human-readable list of metrics that got worse than the baseline allows"""
+    regressions = []
+    for endpoint, metrics in current['summary'].items():
+        base = baseline['summary'].get(endpoint)
+        if not base:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if base[key] and metrics[key] and metrics[key] > base[key] * (1 + tolerance[key]):
+                regressions.append(f"{endpoint} {key}: {base[key]} -> {metrics[key]}")
+        if metrics['throughput'] < base['throughput'] * (1 - tolerance['throughput']):
+            regressions.append(f"{endpoint} throughput: {base['throughput']} -> {metrics['throughput']} req/s")
+        if metrics['error_rate'] > base['error_rate'] + tolerance['error_rate']:
+            regressions.append(f"{endpoint} error_rate: {base['error_rate']} -> {metrics['error_rate']}")
+    return regressions
+
+
+def print_summary(summary):
+    print(f"{'endpoint':<10}{'req':>7}{'err%':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, m in summary.items():
+        p = [f"{m[k]:>9.1f}" if m[k] is not None else f"{'-':>9}" for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{endpoint:<10}{m['requests']:>7}{m['error_rate'] * 100:>7.1f}{m['throughput']:>9.1f}{''.join(p)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the kidney stone API")
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--endpoints', nargs='+', default=['/predict'], help="/predict and/or /explain")
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', type=int, default=8, help="closed loop: concurrent clients")
+    parser.add_argument('--rate', type=float, default=10.0, help="open loop: requests per second")
+    parser.add_argument('--poisson', action='store_true', help="open loop: exponential inter-arrival times")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds")
+    parser.add_argument('--timeout', type=float, default=30.0, help="per-request timeout, seconds")
+    parser.add_argument('--images', type=int, default=100, help="number of dataset images to replay")
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--save-baseline', default=None, help="write results to this JSON file")
+    parser.add_argument('--compare', default=None, help="baseline JSON to check for regressions")
+    args = parser.parse_args()
+
+    images = load_images(args.dataset, args.images)
+    if not images:
+        print(f"❌ No images found in {args.dataset}")
+        return 2
+
+    target = f"{args.concurrency} clients" if args.mode == 'closed' else f"{args.rate:g} req/s"
+    print(f"🚀 {args.mode}-loop load on {args.url} {' '.join(args.endpoints)}: {target} for {args.duration:g}s")
+    if args.mode == 'closed':
+        run = closed_loop(args.url, args.endpoints, images, args.concurrency, args.duration, args.timeout)
+    else:
+        run = open_loop(args.url, args.endpoints, images, args.rate, args.duration, args.timeout, args.poisson)
+    results, elapsed = asyncio.run(run)
+
+    report = {
+        'url': args.url,
+        'mode': args.mode,
+        'concurrency': args.concurrency if args.mode == 'closed' else None,
+        'rate': args.rate if args.mode == 'open' else None,
+        'duration_s': round(elapsed, 2),
+        'images': len(images),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'summary': summarise(results, elapsed),
+    }
+    print_summary(report['summary'])
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or '.', exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline saved to: {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline['mode'], baseline['concurrency'], baseline['rate']) != \
+                (report['mode'], report['concurrency'], report['rate']):
+            print("⚠️ Baseline was recorded with a different load shape - comparison may be meaningless")
+        regressions = find_regressions(report, baseline)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,10 +6,11 @@ Automates the complete workflow: training, backend, and GUI
 
 import subprocess
 import sys
-import time
 import os
 from pathlib import Path
 
+from supervisor import wait_until_ready
+
 def run_command(command, description):
     """Run a command and handle errors"""
     print(f"\n{'='*50}")
@@ -106,21 +107,20 @@ def main():
         print("📊 Setting up quick demo...")
         print("\n🚀 Starting backend server in background...")
         
-        # Start backend in background
-        backend_process = subprocess.Popen(
-            ["python", "backend.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        # Start backend in background; its output goes straight to this terminal
+        backend_process = subprocess.Popen([sys.executable, "backend.py"])
         
-        # Wait for backend to start
-        time.sleep(3)
+        # Wait until the backend answers and its model has loaded
+        if not wait_until_ready("http://localhost:8000/health", process=backend_process):
+            print("❌ Backend did not become ready.")
+            backend_process.terminate()
+            return
         
         print("🖥️ Launching Streamlit GUI...")
         print("Demo will open in your browser!")
         
         try:
-            subprocess.run("streamlit run streamlit_app.py", shell=True)
+            subprocess.run([sys.executable, "-m", "streamlit", "run", "streamlit_app.py"])
         except KeyboardInterrupt:
             print("\n🛑 Stopping demo...")
         finally:
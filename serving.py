@@ -0,0 +1,262 @@
+"""
+Model-agnostic serving helpers for backend.py.
+
+ModelSpec reads the loaded Keras model's input resolution and named outputs,
+so the server can preprocess at the right size and return every head.
+MicroBatcher groups concurrent requests with the same input shape into a
+single predict call. TestTimeAugmentation builds flipped, shifted and
+gamma-adjusted views of one image and scores them in a single batch.
+Cascade lets a cheap model settle confident scans before the heavy one.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+DEFAULT_INPUT_SIZE = (224, 224)
+PRIMARY_OUTPUT = 'stone_detection'
+
+TTA_MODES = ('off', 'auto', 'on')
+
+# gradcam.py's explanation methods, here so the server can validate them before TensorFlow loads
+EXPLAIN_METHODS = ('auto', 'cam', 'gradcam')
+
+TTA_CONFIG = {
+    'mode': os.environ.get('TTA_MODE', 'off'),  # off | auto (uncertainty band only) | on
+    'band': (0.3, 0.7),  # plain scores in this range count as uncertain
+    'shift': 0.04,  # fraction of height/width
+    'gammas': (0.8, 1.25),
+    'average': 'mean',  # mean | logit | median
+}
+
+CASCADE_CONFIG = {
+    'cheap_model': 'kidney_stone_student.h5',
+    'thresholds': 'cascade_thresholds.json',  # written by cascade.py
+}
+
+
+class ModelSpec:
+    """Input shape and output heads of a loaded Keras model"""
+
+    def __init__(self, model):
+        self.model = model
+        _, height, width, channels = model.inputs[0].shape
+        # Fully convolutional models may leave spatial dims undefined
+        self.input_size = (width or DEFAULT_INPUT_SIZE[0], height or DEFAULT_INPUT_SIZE[1])
+        self.channels = channels or 3
+        self.output_names = list(model.output_names)
+        self.primary_output = PRIMARY_OUTPUT if PRIMARY_OUTPUT in self.output_names else self.output_names[0]
+
+    def predict(self, batch):
+        """{output name: (batch, ...) array} for one preprocessed batch"""
+        outputs = self.model.predict_on_batch(batch)
+        if not isinstance(outputs, (list, tuple, dict)):
+            outputs = [outputs]
+        if isinstance(outputs, dict):
+            return {name: np.asarray(value) for name, value in outputs.items()}
+        return {name: np.asarray(value) for name, value in zip(self.output_names, outputs)}
+
+    def describe(self):
+        return {
+            'input_size': list(self.input_size),
+            'outputs': self.output_names,
+            'primary_output': self.primary_output,
+        }
+
+
+class MicroBatcher:
+    """
+    Collect concurrent single-image requests into batches per input shape.
+
+    Each resolution bucket gets its own queue; a bucket's worker waits for
+    the first request, then gathers more for up to max_wait_ms (or until
+    max_batch_size) before running one predict call in a worker thread.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queues = {}
+        self._workers = {}
+        # One model call at a time; batching is where the parallelism comes from
+        self._lock = asyncio.Lock()
+        self.stats = {'batches': 0, 'requests': 0}
+
+    async def submit(self, image):
+        """Predict one (H, W, C) image; returns {output name: per-image array}"""
+        key = image.shape
+        if key not in self._queues:
+            self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._worker(self._queues[key]))
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[key].put((image, future))
+        return await future
+
+    async def _worker(self, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = np.stack([image for image, _ in items])
+            try:
+                async with self._lock:
+                    outputs = await loop.run_in_executor(None, self.predict_fn, batch)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['requests'] += len(items)
+            for i, (_, future) in enumerate(items):
+                if not future.done():
+                    future.set_result({name: value[i] for name, value in outputs.items()})
+
+    async def run(self, batch):
+        """Predict a ready-made batch directly, serialised with the batched calls"""
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(None, self.predict_fn, batch)
+
+    async def close(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        self._queues.clear()
+        self._workers.clear()
+
+
+def tta_views(image, shift=TTA_CONFIG['shift'], gammas=TTA_CONFIG['gammas']):
+    """(views, H, W, C) stack: identity, horizontal flip, 4 edge-padded shifts, gamma variants"""
+    height, width = image.shape[:2]
+    dy, dx = max(1, round(height * shift)), max(1, round(width * shift))
+    padded = np.pad(image, ((dy, dy), (dx, dx), (0, 0)), mode='edge')
+    # Windows of the padded image: up, down, left, right
+    shifted = [padded[y:y + height, x:x + width] for y, x in ((0, dx), (2 * dy, dx), (dy, 0), (dy, 2 * dx))]
+    # Ultrasound depth runs top to bottom, so only flip left-right
+    views = np.stack([image, image[:, ::-1], *shifted])
+    gamma = np.asarray(gammas, dtype=image.dtype)[:, None, None, None]
+    return np.concatenate([views, np.power(image[None], gamma)])
+
+
+def aggregate(scores, method=TTA_CONFIG['average']):
+    """Combine per-view (views, ...) outputs into one"""
+    if method == 'median':
+        return np.median(scores, axis=0)
+    if method == 'logit':
+        p = np.clip(scores, 1e-6, 1 - 1e-6)
+        return 1 / (1 + np.exp(-np.mean(np.log(p / (1 - p)), axis=0)))
+    return np.mean(scores, axis=0)
+
+
+class TestTimeAugmentation:
+    """
+    Decide per request whether to run TTA, and run it as one batch.
+
+    'auto' runs TTA only when the plain primary score is inside the
+    uncertainty band, 'on' runs it for every request. Either way a request's
+    latency budget vetoes it when the elapsed time plus the expected TTA
+    cost (running average of previous TTA calls) would exceed the budget.
+    """
+
+    def __init__(self, config=TTA_CONFIG):
+        self.config = dict(config)
+        self.cost_ms = None
+        self.stats = {'runs': 0, 'skipped_band': 0, 'skipped_budget': 0}
+
+    def num_views(self):
+        return 6 + len(self.config['gammas'])
+
+    def should_run(self, score, mode=None, budget_ms=None, elapsed_ms=0.0, plain_ms=0.0):
+        mode = mode or self.config['mode']
+        if mode not in TTA_MODES:
+            raise ValueError(f"tta_mode must be one of {', '.join(TTA_MODES)}")
+        if mode == 'off':
+            return False
+        low, high = self.config['band']
+        if mode == 'auto' and not low <= score <= high:
+            self.stats['skipped_band'] += 1
+            return False
+        if budget_ms is not None:
+            # Before the first TTA call, assume views cost as much as sequential plain calls
+            expected = self.cost_ms if self.cost_ms is not None else plain_ms * self.num_views()
+            if elapsed_ms + expected > budget_ms:
+                self.stats['skipped_budget'] += 1
+                return False
+        return True
+
+    async def run(self, batcher, image, primary_output=PRIMARY_OUTPUT):
+        """(aggregated, per-view) {output name: array} over all views of one image"""
+        start = time.perf_counter()
+        outputs = await batcher.run(tta_views(image, self.config['shift'], self.config['gammas']))
+        cost = (time.perf_counter() - start) * 1000
+        self.cost_ms = cost if self.cost_ms is None else 0.8 * self.cost_ms + 0.2 * cost
+        self.stats['runs'] += 1
+        # The configured averaging is for the probability head; other heads are plain means
+        return {name: aggregate(value, self.config['average'] if name == primary_output else 'mean')
+                for name, value in outputs.items()}, outputs
+
+    def describe(self):
+        return {**self.config, **self.stats, 'views': self.num_views(),
+                'cost_ms': round(self.cost_ms, 2) if self.cost_ms is not None else None}
+
+
+class Cascade:
+    """
+    Two-stage inference: the cheap model scores every image and only scores
+    inside [low, high] are escalated to the heavy model. Keeps per-stage
+    request counts and latency for /health.
+    """
+
+    def __init__(self, spec, batcher, low, high):
+        self.spec = spec
+        self.batcher = batcher
+        self.low = low
+        self.high = high
+        self.stats = {'requests': 0, 'escalated': 0}
+        self._stage_ms = {'cheap': 0.0, 'heavy': 0.0}
+
+    @classmethod
+    def from_thresholds(cls, spec, batcher, path=CASCADE_CONFIG['thresholds']):
+        with open(path) as f:
+            thresholds = json.load(f)
+        return cls(spec, batcher, thresholds['low'], thresholds['high'])
+
+    async def run_cheap(self, image):
+        """(outputs, primary score) from the cheap model"""
+        start = time.perf_counter()
+        outputs = await self.batcher.submit(image)
+        self.record('cheap', start)
+        self.stats['requests'] += 1
+        return outputs, float(outputs[self.spec.primary_output][0])
+
+    def escalate(self, score):
+        escalate = self.low <= score <= self.high
+        self.stats['escalated'] += int(escalate)
+        return escalate
+
+    def record(self, stage, start):
+        self._stage_ms[stage] += (time.perf_counter() - start) * 1000
+
+    def describe(self):
+        requests, escalated = self.stats['requests'], self.stats['escalated']
+        return {
+            'cheap_input_size': list(self.spec.input_size),
+            'band': [self.low, self.high],
+            **self.stats,
+            'escalation_rate': round(escalated / requests, 4) if requests else None,
+            'cheap_ms_mean': round(self._stage_ms['cheap'] / requests, 3) if requests else None,
+            'heavy_ms_mean': round(self._stage_ms['heavy'] / escalated, 3) if escalated else None,
+        }
@@ -16,6 +16,8 @@ except ImportError:
     from PIL import Image, ImageDraw
     import numpy as np
 
+from cine import aggregate_scores, iter_frames, sample_frames
+
 class SimpleBackend(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         # Handle CORS preflight
@@ -37,29 +39,43 @@ class SimpleBackend(BaseHTTPRequestHandler):
             self.send_response(404)
             self.end_headers()
 
+    def _upload(self):
+        """The uploaded multipart 'file' field, or None after sending an error"""
+        # Parse multipart form data
+        content_type = self.headers['content-type']
+        if not content_type or not content_type.startswith('multipart/form-data'):
+            self.send_error(400, "Expected multipart/form-data")
+            return None
+
+        # Get file data
+        form = cgi.FieldStorage(
+            fp=self.rfile,
+            headers=self.headers,
+            environ={'REQUEST_METHOD': 'POST'}
+        )
+        
+        if 'file' not in form:
+            self.send_error(400, "No file uploaded")
+            return None
+
+        file_item = form['file']
+        if not file_item.file:
+            self.send_error(400, "Empty file")
+            return None
+        return file_item
+
+    def _send_json(self, response):
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
+
     def do_POST(self):
         if self.path == '/predict':
             try:
-                # Parse multipart form data
-                content_type = self.headers['content-type']
-                if not content_type.startswith('multipart/form-data'):
-                    self.send_error(400, "Expected multipart/form-data")
-                    return
-
-                # Get file data
-                form = cgi.FieldStorage(
-                    fp=self.rfile,
-                    headers=self.headers,
-                    environ={'REQUEST_METHOD': 'POST'}
-                )
-                
-                if 'file' not in form:
-                    self.send_error(400, "No file uploaded")
-                    return
-
-                file_item = form['file']
-                if not file_item.file:
-                    self.send_error(400, "Empty file")
+                file_item = self._upload()
+                if file_item is None:
                     return
 
                 # Read image data
@@ -94,6 +110,34 @@ class SimpleBackend(BaseHTTPRequestHandler):
             except Exception as e:
                 self.send_error(500, f"Server error: {str(e)}")
 
+        elif self.path == '/predict/study':
+            try:
+                file_item = self._upload()
+                if file_item is None:
+                    return
+
+                # Cine loop: sample changing frames, demo-score each from its pixels
+                stats = {}
+                frame_scores = []
+                for index, frame in sample_frames(iter_frames(file_item.file, file_item.filename), stats):
+                    frame_hash = hashlib.md5(frame.tobytes()).hexdigest()
+                    frame_scores.append({"frame": index, "score": (int(frame_hash[:8], 16) % 100) / 100.0})
+                study = aggregate_scores([f["score"] for f in frame_scores])
+
+                prediction = study["score"]
+                label = "Stone" if prediction > 0.5 else "Normal"
+                confidence_score = prediction if prediction > 0.5 else 1 - prediction
+                self._send_json({
+                    "prediction": label,
+                    "confidence": round(confidence_score * 100, 2),
+                    "raw_score": prediction,
+                    "study": study,
+                    "frames": stats,
+                    "frame_scores": frame_scores
+                })
+
+            except Exception as e:
+                self.send_error(400, f"Study error: {str(e)}")
 
         else:
             self.send_error(404, "Not found")
@@ -6,6 +6,10 @@ from tensorflow.keras.applications import EfficientNetB0
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 from tensorflow.keras.models import Sequential
 
+from dataset_index import flow_from_manifest
+from training_monitor import ThroughputMonitor
+from importance_sampling import importance_sampling
+
 # Disable GPU to avoid mutex issues
 os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 
@@ -45,39 +49,34 @@ def main():
         return
     
     # Simple data generator
-    datagen = ImageDataGenerator(
-        rescale=1./255,
-        validation_split=0.2
-    )
+    datagen = ImageDataGenerator(rescale=1./255)
     
     try:
-        # Load data
-        train_generator = datagen.flow_from_directory(
-            dataset_path,
+        # Load data from the shared manifest split
+        train_generator = flow_from_manifest(
+            datagen, 'train',
+            dataset_path=dataset_path,
             target_size=(224, 224),
-            batch_size=16,
-            class_mode='binary',
-            subset='training',
-            classes=['Normal', 'stone']
+            batch_size=16
         )
         
-        val_generator = datagen.flow_from_directory(
-            dataset_path,
+        val_generator = flow_from_manifest(
+            datagen, 'val',
+            dataset_path=dataset_path,
             target_size=(224, 224),
-            batch_size=16,
-            class_mode='binary',
-            subset='validation',
-            classes=['Normal', 'stone']
+            batch_size=16
         )
         
         # Create and train model
         model = create_simple_model()
         print("Training model...")
         
+        monitor = ThroughputMonitor('simple_train')
         history = model.fit(
-            train_generator,
+            monitor.wrap(importance_sampling(train_generator, model)),
             epochs=5,  # Reduced epochs for quick training
             validation_data=val_generator,
+            callbacks=[monitor],
             verbose=1
         )
         
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 import subprocess
-import time
 import sys
 
+from supervisor import wait_until_ready
+
 def start_system():
     print("🏥 Starting Kidney Stone Detection System...")
     
@@ -10,12 +11,15 @@ def start_system():
     print("🚀 Starting backend server...")
     backend = subprocess.Popen([sys.executable, "simple_backend.py"])
     
-    # Wait for backend to start
-    time.sleep(3)
+    # Wait until the backend answers instead of guessing how long it takes
+    if not wait_until_ready("http://localhost:8000/health", timeout=60, process=backend):
+        print("❌ Backend did not start")
+        backend.terminate()
+        return
     
-    # Start Streamlit
+    # Start Streamlit from the same interpreter's environment
     print("🖥️ Starting Streamlit GUI...")
-    streamlit = subprocess.Popen(["/Users/subhajitbepari/Library/Python/3.9/bin/streamlit", "run", "streamlit_app.py"])
+    streamlit = subprocess.Popen([sys.executable, "-m", "streamlit", "run", "streamlit_app.py"])
     
     print("✅ System started!")
     print("📱 GUI: http://localhost:8501")
@@ -1,9 +1,9 @@
 import streamlit as st
 import requests
-import numpy as np
 from PIL import Image
 import io
 import base64
+import time
 
 # Page config
 st.set_page_config(
@@ -339,6 +339,28 @@ st.markdown("""
 
 # Backend URL
 BACKEND_URL = "http://127.0.0.1:8000"
+EXPLAIN_TIMEOUT = 120  # seconds to wait for an explanation job
+
+def request_explanation(files):
+    """Submit an explanation job and poll until it finishes; falls back to the synchronous /explain"""
+    response = requests.post(f"{BACKEND_URL}/explain/jobs", files=files, timeout=30)
+    if response.status_code == 404:
+        files["file"][1].seek(0)
+        response = requests.post(f"{BACKEND_URL}/explain", files=files, timeout=EXPLAIN_TIMEOUT)
+        return response.json() if response.status_code == 200 else None
+    if response.status_code != 202:
+        return None
+    
+    job_url = f"{BACKEND_URL}/explain/jobs/{response.json()['job_id']}"
+    deadline = time.time() + EXPLAIN_TIMEOUT
+    while time.time() < deadline:
+        job = requests.get(job_url, timeout=5).json()
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            return None
+        time.sleep(0.5)
+    return None
 
 def check_backend():
     try:
@@ -389,7 +411,7 @@ with col1:
                         img_bytes.seek(0)
                         
                         files = {"file": ("image.png", img_bytes, "image/png")}
-                        response = requests.post(f"{BACKEND_URL}/predict", files=files)
+                        response = requests.post(f"{BACKEND_URL}/predict", files=files, timeout=30)
                         
                         if response.status_code == 200:
                             result = response.json()
@@ -454,10 +476,9 @@ with col2:
                     img_bytes.seek(0)
                     
                     files = {"file": ("image.png", img_bytes, "image/png")}
-                    response = requests.post(f"{BACKEND_URL}/explain", files=files)
+                    gradcam_result = request_explanation(files)
                     
-                    if response.status_code == 200:
-                        gradcam_result = response.json()
+                    if gradcam_result:
                         st.image(gradcam_result['heatmap'], caption="🔥 AI Focus Areas (Grad-CAM)", use_container_width=True)
                         st.info("🎯 Red/warm areas show where the AI focused its attention for the diagnosis.")
                     else:
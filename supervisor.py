@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Local process supervisor and load balancer for the backend.
+
+Starts N backend replicas on consecutive ports, each pinned to its own share
+of the CPU cores (and told to size its thread pools to match), and puts a
+small reverse proxy in front of them on one port:
+
+- readiness: a replica gets traffic once GET /health answers and its model
+  has finished loading; that is polled for, never slept for
+- restarts: a replica that exits, or fails health_failures health checks in
+  a row, is restarted with exponential backoff
+- logs: each replica's stdout/stderr is read as it is written and printed
+  with a [replica N] prefix, so no pipe ever fills up
+- routing: each request goes to the ready replica with the fewest requests
+  in flight. Each replica keeps its own explanation job database, so job
+  status and event requests go to the replica that accepted the job
+
+    python3 supervisor.py --replicas 4 --port 8000
+    curl localhost:8000/supervisor  # replica status
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import sys
+import time
+import urllib.request
+from collections import OrderedDict
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUPERVISOR_CONFIG = {
+    'replicas': int(os.environ.get('REPLICAS', '2')),
+    'host': '0.0.0.0',
+    'port': int(os.environ.get('PORT', '8000')),  # proxy
+    'base_port': 8101,  # replica i listens on base_port + i
+    'server': 'backend',  # backend | simple
+    'ready_timeout': 300,  # seconds for a replica to start and load its model
+    'poll_interval': 0.25,  # seconds between readiness polls
+    'health_interval': 5.0,  # seconds between health checks once ready
+    'health_timeout': 10.0,
+    'health_failures': 3,  # consecutive failed checks before a restart
+    'restart_backoff': 1.0,  # seconds, doubled after each restart
+    'max_backoff': 30.0,
+    'stable_after': 60.0,  # seconds up before the backoff resets
+    'connect_timeout': 5.0,
+    'max_jobs_tracked': 10000,  # explanation job ids remembered for routing
+}
+
+# Launch command per server kind; cold_start.py starts servers the same way
+SERVERS = {
+    'backend': lambda port: [sys.executable, '-m', 'uvicorn', '--app-dir', REPO_DIR, 'backend:app',
+                             '--host', '127.0.0.1', '--port', str(port)],
+    'simple': lambda port: [sys.executable, os.path.join(REPO_DIR, 'simple_backend.py')],
+}
+
+# Headers that describe one connection rather than the request
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+              'expect', 'content-length'}
+
+JOB_PATH = re.compile(r'^/explain/jobs/([0-9a-f]+)')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 502: 'Bad Gateway', 503: 'Service Unavailable'}
+
+
+def allocate_cores(replicas):
+    """Disjoint core lists, one per replica (shared round-robin when there are more replicas than cores)"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    if replicas >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(replicas)]
+    per_replica = len(cores) // replicas
+    return [cores[i * per_replica:(i + 1) * per_replica] for i in range(replicas)]
+
+
+def wait_until_ready(url, timeout=300, process=None, poll_interval=0.25):
+    """Poll a /health URL until it answers and the model has loaded; False on timeout or if process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if not json.loads(response.read() or b'{}').get('model_loading'):
+                    return True
+        except (OSError, ValueError):
+            pass
+        time.sleep(poll_interval)
+    return False
+
+
+async def read_head(reader):
+    """(first line, [(name, value)]) of an HTTP message"""
+    lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    headers = [tuple(part.strip() for part in line.split(':', 1)) for line in lines[1:] if ':' in line]
+    return lines[0], headers
+
+
+def header(headers, name, default=None):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return default
+
+
+async def read_body(reader, writer, headers):
+    if header(headers, 'expect', '').lower() == '100-continue':
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        await writer.drain()
+    if header(headers, 'transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass  # trailers
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    return await reader.readexactly(int(header(headers, 'content-length', 0)))
+
+
+async def respond(writer, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode()
+    head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', 'Content-Type: application/json',
+            f'Content-Length: {len(body)}', 'Connection: close', *extra_headers]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+
+async def probe(port, timeout):
+    """Parsed GET /health of a replica, or None if it doesn't answer 200"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(f'GET /health HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    if head.split(b' ', 2)[1:2] != [b'200']:
+        return None
+    return json.loads(body or b'{}')
+
+
+class Replica:
+    """One backend process: start, wait for readiness, health-check and restart it"""
+
+    def __init__(self, index, port, cores, config=SUPERVISOR_CONFIG):
+        self.index = index
+        self.port = port
+        self.cores = cores
+        self.config = config
+        self.name = f'replica {index}'
+        self.process = None
+        self.ready = False
+        self.outstanding = 0
+        self.stats = {'served': 0, 'restarts': 0}
+        self._logs = None
+
+    def environment(self):
+        threads = str(len(self.cores))
+        jobs_db, ext = os.path.splitext(os.environ.get('EXPLAIN_JOBS_DB', 'explain_jobs.db'))
+        return {**os.environ, 'PORT': str(self.port),
+                # Thread pools sized to the pinned cores instead of every core on the machine
+                'OMP_NUM_THREADS': threads, 'TF_NUM_INTRAOP_THREADS': threads,
+                'EXPLAIN_JOBS_DB': f'{jobs_db}.{self.index}{ext}'}
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *SERVERS[self.config['server']](self.port), env=self.environment(),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=1 << 20)
+        if hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(self.process.pid, self.cores)
+            except OSError as e:
+                print(f"⚠️ {self.name}: can't pin to cores {self.cores}: {e}")
+        self._logs = asyncio.create_task(self._pump_logs())
+        print(f"🚀 {self.name}: pid {self.process.pid}, port {self.port}, cores {self.cores}")
+
+    async def _pump_logs(self):
+        async for line in self.process.stdout:
+            print(f"[{self.name}] {line.decode(errors='replace').rstrip()}", flush=True)
+
+    async def wait_ready(self):
+        deadline = time.monotonic() + self.config['ready_timeout']
+        while self.process.returncode is None and time.monotonic() < deadline:
+            try:
+                health = await probe(self.port, self.config['health_timeout'])
+                if health is not None and not health.get('model_loading'):
+                    return True
+            except (OSError, asyncio.TimeoutError, ValueError):
+                pass
+            await asyncio.sleep(self.config['poll_interval'])
+        return False
+
+    async def monitor(self):
+        """Wait until the process exits or fails too many health checks; returns why"""
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self.process.wait(), self.config['health_interval'])
+                return f"exited with code {self.process.returncode}"
+            except asyncio.TimeoutError:
+                pass
+            try:
+                healthy = await probe(self.port, self.config['health_timeout']) is not None
+            except (OSError, asyncio.TimeoutError, ValueError):
+                healthy = False
+            failures = 0 if healthy else failures + 1
+            if failures >= self.config['health_failures']:
+                return f"failed {failures} health checks"
+
+    async def stop(self, timeout=10):
+        self.ready = False
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.terminate()
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+            except ProcessLookupError:
+                pass
+        if self._logs:
+            await self._logs  # rest of the log
+
+    async def run(self):
+        """Keep the replica running until cancelled"""
+        backoff = self.config['restart_backoff']
+        while True:
+            started = time.monotonic()
+            try:
+                await self.start()
+            except OSError as e:
+                reason = f"failed to start: {e}"
+            else:
+                if await self.wait_ready():
+                    self.ready = True
+                    print(f"✅ {self.name} ready after {time.monotonic() - started:.1f}s")
+                    reason = await self.monitor()
+                elif self.process.returncode is not None:
+                    reason = f"exited with code {self.process.returncode}"
+                else:
+                    reason = f"not ready after {self.config['ready_timeout']}s"
+                await self.stop()
+            if time.monotonic() - started > self.config['stable_after']:
+                backoff = self.config['restart_backoff']
+            self.stats['restarts'] += 1
+            print(f"🔁 {self.name} {reason}; restarting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.config['max_backoff'])
+
+    def describe(self):
+        return {'port': self.port, 'pid': self.process.pid if self.process else None, 'cores': self.cores,
+                'ready': self.ready, 'outstanding': self.outstanding, **self.stats}
+
+
+class Balancer:
+    """HTTP reverse proxy sending each request to the ready replica with the fewest in flight"""
+
+    def __init__(self, replicas, config=SUPERVISOR_CONFIG):
+        self.replicas = replicas
+        self.config = config
+        self.jobs = OrderedDict()  # explanation job id -> replica that runs it
+        self._turn = 0
+
+    def pick(self, path, exclude=()):
+        match = JOB_PATH.match(path)
+        replica = self.jobs.get(match.group(1)) if match else None
+        if replica is not None and replica.ready and replica not in exclude:
+            return replica
+        ready = [r for r in self.replicas if r.ready and r not in exclude]
+        if not ready:
+            return None
+        # Rotate the starting point so ties don't all land on replica 0
+        self._turn = (self._turn + 1) % len(ready)
+        return min(ready[self._turn:] + ready[:self._turn], key=lambda r: r.outstanding)
+
+    def remember_job(self, body, replica):
+        try:
+            job_id = json.loads(body)['job_id']
+        except (ValueError, KeyError, TypeError):
+            return
+        self.jobs[job_id] = replica
+        while len(self.jobs) > self.config['max_jobs_tracked']:
+            self.jobs.popitem(last=False)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request_line, headers = await read_head(reader)
+                method, target, _ = request_line.split(' ', 2)
+                body = await read_body(reader, writer, headers)
+            except asyncio.IncompleteReadError:
+                return
+            except (asyncio.LimitOverrunError, ValueError):
+                await respond(writer, 400, {'detail': 'malformed request'})
+                return
+            if target == '/supervisor':
+                await respond(writer, 200, self.describe())
+                return
+
+            tried = []
+            while True:
+                replica = self.pick(target.split('?', 1)[0], tried)
+                if replica is None:
+                    await respond(writer, 503, {'detail': 'no backend replica is ready'}, ['Retry-After: 1'])
+                    return
+                try:
+                    upstream = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', replica.port),
+                                                      self.config['connect_timeout'])
+                    break
+                except (OSError, asyncio.TimeoutError):
+                    tried.append(replica)  # restarting; its health checks will catch up
+
+            replica.outstanding += 1
+            try:
+                await self.forward(upstream, replica, method, target, headers, body, writer)
+            finally:
+                replica.outstanding -= 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            writer.close()
+
+    async def forward(self, upstream, replica, method, target, headers, body, writer):
+        up_reader, up_writer = upstream
+        client = writer.get_extra_info('peername')
+        head = [f'{method} {target} HTTP/1.1'] + [f'{k}: {v}' for k, v in headers if k.lower() not in HOP_BY_HOP]
+        head += [f'Content-Length: {len(body)}', f'X-Forwarded-For: {client[0] if client else "unknown"}',
+                 'Connection: close']
+        sent_head = False
+        try:
+            up_writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await up_writer.drain()
+            status_line, response_headers = await read_head(up_reader)
+            # Job submissions are read whole to learn which replica owns the job
+            owned_job = method == 'POST' and target.split('?', 1)[0] == '/explain/jobs'
+            rest = await up_reader.read() if owned_job else b''
+            if owned_job:
+                self.remember_job(rest, replica)
+            response_head = [status_line] + [f'{k}: {v}' for k, v in response_headers
+                                             if k.lower() not in ('connection', 'keep-alive')]
+            writer.write(('\r\n'.join(response_head + ['Connection: close']) + '\r\n\r\n').encode('latin-1') + rest)
+            sent_head = True
+            # Copied as it arrives, so event streams reach the client live
+            while chunk := await up_reader.read(1 << 16):
+                writer.write(chunk)
+                await writer.drain()
+            await writer.drain()
+            replica.stats['served'] += 1
+        except (OSError, asyncio.IncompleteReadError) as e:
+            if not sent_head:
+                await respond(writer, 502, {'detail': f'{replica.name} failed: {e or type(e).__name__}'})
+        finally:
+            up_writer.close()
+
+    def describe(self):
+        return {'replicas': [r.describe() for r in self.replicas], 'jobs_tracked': len(self.jobs)}
+
+
+async def supervise(config=SUPERVISOR_CONFIG):
+    cores = allocate_cores(config['replicas'])
+    replicas = [Replica(i, config['base_port'] + i, cores[i], config) for i in range(config['replicas'])]
+    balancer = Balancer(replicas, config)
+    server = await asyncio.start_server(balancer.handle, config['host'], config['port'])
+    print(f"⚖️  Proxy on {config['host']}:{config['port']} -> {len(replicas)} {config['server']} replica(s)")
+    tasks = [asyncio.create_task(replica.run()) for replica in replicas]
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("🛑 Stopping replicas...")
+    server.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*(replica.stop() for replica in replicas))
+    print("✅ Supervisor stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run backend replicas behind a least-outstanding-requests proxy")
+    parser.add_argument('--replicas', type=int, default=SUPERVISOR_CONFIG['replicas'])
+    parser.add_argument('--port', type=int, default=SUPERVISOR_CONFIG['port'])
+    parser.add_argument('--base-port', type=int, default=SUPERVISOR_CONFIG['base_port'])
+    parser.add_argument('--server', choices=sorted(SERVERS), default=SUPERVISOR_CONFIG['server'])
+    args = parser.parse_args()
+
+    asyncio.run(supervise({**SUPERVISOR_CONFIG, 'replicas': args.replicas, 'port': args.port,
+                           'base_port': args.base_port, 'server': args.server}))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Summarise a training throughput log written by training_monitor.ThroughputMonitor.
+
+Usage:
+    python3 throughput_report.py                         # training_throughput.jsonl
+    python3 throughput_report.py my_log.jsonl --run train_real_model/frozen
+"""
+
+import argparse
+import json
+import os
+import statistics
+from collections import OrderedDict
+
+LOG_PATH = "training_throughput.jsonl"  # training_monitor.LOG_PATH, without importing TensorFlow
+
+# Share of step time spent waiting for data above which an epoch is input-bound
+INPUT_BOUND_THRESHOLD = 0.3
+
+
+def summarise(log_path, run=None):
+    epochs = OrderedDict()
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if run and record['run'] != run:
+                continue
+            key = (record['run'], record['epoch'])
+            summary = epochs.setdefault(key, {'steps': [], 'epoch': None})
+            if record['type'] == 'step':
+                summary['steps'].append(record)
+            else:
+                summary['epoch'] = record
+    return epochs
+
+
+def print_report(epochs):
+    header = f"{'run':<32} {'ep':>3} {'steps':>6} {'time s':>8} {'wait %':>7} {'compute %':>9} {'step ms':>8} {'img/s':>8} {'RSS MB':>8}  verdict"
+    print(header)
+    print('-' * len(header))
+    for (run, epoch), summary in epochs.items():
+        steps = summary['steps']
+        if not steps:
+            continue
+        total = sum(s['step_ms'] for s in steps)
+        epoch_record = summary['epoch'] or {}
+        epoch_s = epoch_record.get('epoch_s', total / 1000)
+        images_per_sec = epoch_record.get('images_per_sec') or 0
+        peak_rss = max(s['peak_rss_mb'] for s in steps)
+        # Steps from an unwrapped iterator have no data-wait timing (null)
+        timed = [s for s in steps if s.get('data_wait_ms') is not None]
+        if timed:
+            timed_total = sum(s['step_ms'] for s in timed)
+            wait_share = sum(s['data_wait_ms'] for s in timed) / timed_total if timed_total else 0
+            wait, compute = f"{wait_share * 100:>6.1f}%", f"{(1 - wait_share) * 100:>8.1f}%"
+            verdict = "input-bound" if wait_share > INPUT_BOUND_THRESHOLD else "compute-bound"
+        else:
+            wait, compute = f"{'-':>7}", f"{'-':>9}"
+            verdict = "not measured (iterator not wrapped)"
+        print(f"{run:<32} {epoch:>3} {len(steps):>6} {epoch_s:>8.1f} {wait} "
+              f"{compute} {statistics.median(s['step_ms'] for s in steps):>8.1f} "
+              f"{images_per_sec:>8.1f} {peak_rss:>8.0f}  {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Where did each training epoch's time go?")
+    parser.add_argument('log', nargs='?', default=LOG_PATH)
+    parser.add_argument('--run', help="only show this run name")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"❌ Log not found: {args.log}")
+        return
+    print_report(summarise(args.log, args.run))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,23 @@ from sklearn.metrics import classification_report, confusion_matrix, roc_auc_sco
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+import argparse
 import os
 
+from dataset_index import flow_from_manifest
+from fast_training import enable_fast_training, StepTimeLogger
+from training_monitor import ThroughputMonitor
+from importance_sampling import importance_sampling
+
 class KidneyStoneDetector:
-    def __init__(self, data_path, img_size=(224, 224), batch_size=32):
+    def __init__(self, data_path, img_size=(224, 224), batch_size=32, fast=False):
         self.data_path = data_path
         self.img_size = img_size
         self.batch_size = batch_size
+        self.fast = fast
         self.models = {}
+        # Mixed precision policy must be set before any model is built
+        self.compile_kwargs = enable_fast_training(fast)
         
     def create_data_generators(self):
         # Data augmentation for training
@@ -27,44 +36,31 @@ class KidneyStoneDetector:
             shear_range=0.2,
             zoom_range=0.2,
             horizontal_flip=True,
-            brightness_range=[0.8, 1.2],
-            validation_split=0.3  # 70% train, 30% for val+test
+            brightness_range=[0.8, 1.2]
         )
         
-        val_test_datagen = ImageDataGenerator(
-            rescale=1./255,
-            validation_split=0.5  # Split the 30% into 15% val, 15% test
-        )
+        val_test_datagen = ImageDataGenerator(rescale=1./255)
         
-        # Training data (70%)
-        self.train_generator = train_datagen.flow_from_directory(
-            self.data_path,
+        # Splits come from the shared dataset manifest (70% train, 15% val, 15% test)
+        self.train_generator = flow_from_manifest(
+            train_datagen, 'train',
+            dataset_path=self.data_path,
             target_size=self.img_size,
-            batch_size=self.batch_size,
-            class_mode='binary',
-            subset='training',
-            classes=['Normal', 'stone']
+            batch_size=self.batch_size
         )
         
-        # Validation data (15%)
-        self.val_generator = val_test_datagen.flow_from_directory(
-            self.data_path,
+        self.val_generator = flow_from_manifest(
+            val_test_datagen, 'val',
+            dataset_path=self.data_path,
             target_size=self.img_size,
-            batch_size=self.batch_size,
-            class_mode='binary',
-            subset='training',
-            classes=['Normal', 'stone']
+            batch_size=self.batch_size
         )
         
-        # Test data (15%)
-        self.test_generator = val_test_datagen.flow_from_directory(
-            self.data_path,
+        self.test_generator = flow_from_manifest(
+            val_test_datagen, 'test',
+            dataset_path=self.data_path,
             target_size=self.img_size,
-            batch_size=self.batch_size,
-            class_mode='binary',
-            subset='validation',
-            classes=['Normal', 'stone'],
-            shuffle=False
+            batch_size=self.batch_size
         )
         
     def create_model(self, base_model_name='efficientnet'):
@@ -81,19 +77,22 @@ class KidneyStoneDetector:
         x = GlobalAveragePooling2D()(x)
         x = Dense(128, activation='relu')(x)
         x = Dropout(0.5)(x)
-        predictions = Dense(1, activation='sigmoid')(x)
+        predictions = Dense(1, activation='sigmoid', dtype='float32')(x)  # float32 scores under mixed precision
         
         model = Model(inputs=base_model.input, outputs=predictions)
         model.compile(
             optimizer=Adam(learning_rate=0.001),
             loss='binary_crossentropy',
-            metrics=['accuracy']
+            metrics=['accuracy'],
+            **self.compile_kwargs
         )
         
         return model
     
     def train_model(self, model_name='efficientnet', epochs=20):
         model = self.create_model(model_name)
+        # Loss-weighted batches when IMPORTANCE_SAMPLING=1, else the generator as is
+        train_data = importance_sampling(self.train_generator, model)
         
         # Callbacks
         callbacks = [
@@ -102,11 +101,12 @@ class KidneyStoneDetector:
         ]
         
         # Train model
+        monitor = ThroughputMonitor(f'train_model/{model_name}/frozen')
         history = model.fit(
-            self.train_generator,
+            monitor.wrap(train_data),
             epochs=epochs,
             validation_data=self.val_generator,
-            callbacks=callbacks
+            callbacks=callbacks + [StepTimeLogger(f'train_model/{model_name}', 'frozen', self.fast), monitor]
         )
         
         # Fine-tuning
@@ -114,14 +114,16 @@ class KidneyStoneDetector:
         model.compile(
             optimizer=Adam(learning_rate=0.0001),
             loss='binary_crossentropy',
-            metrics=['accuracy']
+            metrics=['accuracy'],
+            **self.compile_kwargs
         )
         
+        monitor = ThroughputMonitor(f'train_model/{model_name}/fine_tune')
         history_fine = model.fit(
-            self.train_generator,
+            monitor.wrap(train_data),
             epochs=10,
             validation_data=self.val_generator,
-            callbacks=callbacks
+            callbacks=callbacks + [StepTimeLogger(f'train_model/{model_name}', 'fine_tune', self.fast), monitor]
         )
         
         self.models[model_name] = model
@@ -162,9 +164,9 @@ class KidneyStoneDetector:
         print(f"Best model ({best_model_name}) saved!")
         return best_model_name
 
-def main():
+def main(fast=False):
     # Initialize detector
-    detector = KidneyStoneDetector('Kidney Ultrasound Images Stone and No Stone')
+    detector = KidneyStoneDetector('Kidney Ultrasound Images Stone and No Stone', fast=fast)
     
     # Create data generators
     detector.create_data_generators()
@@ -180,4 +182,7 @@ def main():
     detector.save_best_model()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train and compare EfficientNetB0 / ResNet50")
+    parser.add_argument('--fast', action='store_true', help="bfloat16 mixed precision + XLA")
+    args = parser.parse_args()
+    main(fast=args.fast)
\ No newline at end of file
@@ -5,14 +5,23 @@ from tensorflow.keras.models import Sequential
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
+import argparse
 import os
 
+from dataset_index import load_manifest, split_counts, flow_from_manifest
+from fast_training import enable_fast_training, StepTimeLogger
+from checkpointing import AsyncCheckpoint, load_checkpoint, restore_checkpoint
+from training_monitor import ThroughputMonitor
+from importance_sampling import importance_sampling
+
+CHECKPOINT_DIR = "checkpoints/train_real_model"
+
 # Disable GPU issues on Mac
 os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 tf.config.threading.set_inter_op_parallelism_threads(1)
 tf.config.threading.set_intra_op_parallelism_threads(1)
 
-def create_model():
+def create_model(compile_kwargs=None):
     model = Sequential([
         EfficientNetB0(
             weights='imagenet',
@@ -27,7 +36,7 @@ def create_model():
         Dropout(0.3),
         Dense(128, activation='relu'),
         Dropout(0.2),
-        Dense(1, activation='sigmoid')
+        Dense(1, activation='sigmoid', dtype='float32')  # keep scores in float32 under mixed precision
     ])
     
     # Freeze base model initially
@@ -36,12 +45,13 @@ def create_model():
     model.compile(
         optimizer=Adam(learning_rate=0.001),
         loss='binary_crossentropy',
-        metrics=['accuracy', 'precision', 'recall']
+        metrics=['accuracy', 'precision', 'recall'],
+        **(compile_kwargs or {})
     )
     
     return model
 
-def train_model():
+def train_model(fast=False, resume=False, profile_steps=None):
     dataset_path = "Kidney Ultrasound Images Stone and No Stone"
     
     if not os.path.exists(dataset_path):
@@ -49,14 +59,17 @@ def train_model():
         print("Please ensure dataset exists with Normal/ and stone/ folders")
         return
     
-    # Check dataset size
-    normal_count = len(os.listdir(os.path.join(dataset_path, "Normal")))
-    stone_count = len(os.listdir(os.path.join(dataset_path, "stone")))
+    # Check dataset size (from the manifest, no directory walk)
+    entries = load_manifest(dataset_path)
+    normal_count = sum(1 for e in entries if e['label'] == 'Normal')
+    stone_count = len(entries) - normal_count
+    splits = split_counts(entries)
     
     print(f"📊 Dataset Info:")
     print(f"   Normal images: {normal_count}")
     print(f"   Stone images: {stone_count}")
     print(f"   Total: {normal_count + stone_count}")
+    print(f"   Split: {splits['train']} train / {splits['val']} val / {splits['test']} test")
     
     if normal_count + stone_count < 100:
         print("⚠️  Small dataset detected. Consider adding more images for better results.")
@@ -71,39 +84,38 @@ def train_model():
         zoom_range=0.3,
         horizontal_flip=True,
         brightness_range=[0.7, 1.3],
-        fill_mode='nearest',
-        validation_split=0.2
+        fill_mode='nearest'
     )
     
-    val_datagen = ImageDataGenerator(
-        rescale=1./255,
-        validation_split=0.2
-    )
+    val_datagen = ImageDataGenerator(rescale=1./255)
     
-    # Load data
-    train_generator = train_datagen.flow_from_directory(
-        dataset_path,
+    # Load data from the shared manifest split
+    train_generator = flow_from_manifest(
+        train_datagen, 'train',
+        dataset_path=dataset_path,
         target_size=(224, 224),
         batch_size=16,
-        class_mode='binary',
-        subset='training',
-        classes=['Normal', 'stone'],
-        shuffle=True
+        seed=42
     )
     
-    val_generator = val_datagen.flow_from_directory(
-        dataset_path,
+    val_generator = flow_from_manifest(
+        val_datagen, 'val',
+        dataset_path=dataset_path,
         target_size=(224, 224),
-        batch_size=16,
-        class_mode='binary',
-        subset='validation',
-        classes=['Normal', 'stone'],
-        shuffle=False
+        batch_size=16
     )
     
-    # Create model
-    model = create_model()
+    # Create model (the dtype policy must be set before any layers are built)
+    compile_kwargs = enable_fast_training(fast)
+    model = create_model(compile_kwargs)
     print("🧠 Model created with EfficientNetB0 backbone")
+    # Loss-weighted batches when IMPORTANCE_SAMPLING=1, else the generator as is
+    train_data = importance_sampling(train_generator, model)
+    
+    # Full training state from a previous (interrupted) run
+    state = load_checkpoint(CHECKPOINT_DIR) if resume else None
+    if resume and state is None:
+        print("⚠️ No checkpoint found - starting from scratch")
     
     # Callbacks
     callbacks = [
@@ -130,14 +142,24 @@ def train_model():
     
     print("🚀 Starting training...")
     
-    # Phase 1: Train with frozen backbone
-    history1 = model.fit(
-        train_generator,
-        epochs=20,
-        validation_data=val_generator,
-        callbacks=callbacks,
-        verbose=1
-    )
+    # Phase 1: Train with frozen backbone (skipped if resuming into phase 2)
+    if state is None or state['phase'] == 'frozen':
+        checkpoint = AsyncCheckpoint(CHECKPOINT_DIR, 'frozen', callbacks, train_data)
+        initial_epoch = restore_checkpoint(model, state, train_data, checkpoint) if state else 0
+        state = None
+        monitor = ThroughputMonitor('train_real_model/frozen', profile_steps=profile_steps)
+        history1 = model.fit(
+            monitor.wrap(train_data),
+            epochs=20,
+            initial_epoch=initial_epoch,
+            validation_data=val_generator,
+            callbacks=callbacks + [
+                StepTimeLogger('train_real_model', 'frozen', fast),
+                checkpoint,
+                monitor
+            ],
+            verbose=1
+        )
     
     print("🔓 Unfreezing backbone for fine-tuning...")
     
@@ -146,14 +168,23 @@ def train_model():
     model.compile(
         optimizer=Adam(learning_rate=0.0001),  # Lower learning rate
         loss='binary_crossentropy',
-        metrics=['accuracy', 'precision', 'recall']
+        metrics=['accuracy', 'precision', 'recall'],
+        **compile_kwargs
     )
     
+    checkpoint = AsyncCheckpoint(CHECKPOINT_DIR, 'fine_tune', callbacks, train_data)
+    initial_epoch = restore_checkpoint(model, state, train_data, checkpoint) if state else 0
+    monitor = ThroughputMonitor('train_real_model/fine_tune')
     history2 = model.fit(
-        train_generator,
+        monitor.wrap(train_data),
         epochs=15,
+        initial_epoch=initial_epoch,
         validation_data=val_generator,
-        callbacks=callbacks,
+        callbacks=callbacks + [
+            StepTimeLogger('train_real_model', 'fine_tune', fast),
+            checkpoint,
+            monitor
+        ],
         verbose=1
     )
     
@@ -172,4 +203,10 @@ def train_model():
     print(f"🚀 Start backend: python3 simple_backend.py")
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the EfficientNetB0 kidney stone model")
+    parser.add_argument('--fast', action='store_true', help="bfloat16 mixed precision + XLA")
+    parser.add_argument('--resume', action='store_true', help="continue from the latest checkpoint")
+    parser.add_argument('--profile', nargs=2, type=int, metavar=('START', 'STOP'),
+                        help="capture a TensorBoard profiler trace for steps START..STOP")
+    args = parser.parse_args()
+    train_model(fast=args.fast, resume=args.resume, profile_steps=args.profile)
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Training throughput instrumentation.
+
+ThroughputMonitor is a Keras callback that logs one JSONL record per training
+step: step wall time, how long the step waited for its input batch, the
+remaining compute time, images/sec and peak RSS. Wrap the training iterator
+with monitor.wrap() so batch production is timed as well:
+
+    monitor = ThroughputMonitor('train_real_model/frozen')
+    model.fit(monitor.wrap(train_generator), callbacks=[monitor], ...)
+
+Keras prefetches batches from the iterator on a background thread (in
+production order, whatever batch indices it shuffles), so a step only waits
+for data when its batch was finished after the step began; that overlap is
+what's reported as data_wait_ms. wrap() also takes a tf.data.Dataset, whose
+batches are timestamped as they leave the pipeline. Steps without input
+timing (an unwrapped iterator, or the first step of a fit(), which is
+dominated by tracing) log data_wait_ms and compute_ms as null.
+
+Pass profile_steps=(start, stop) to capture a TensorBoard profiler trace over
+that window of global steps. Summarise a log with throughput_report.py.
+"""
+
+import json
+import resource
+import sys
+import time
+from collections import deque
+
+import tensorflow as tf
+
+LOG_PATH = "training_throughput.jsonl"
+PROFILE_DIR = "logs/profile"
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class TimedSequence(tf.keras.utils.Sequence):
+    """Sequence wrapper recording when and how fast each batch is produced"""
+
+    def __init__(self, sequence, monitor):
+        super().__init__()
+        self.sequence = sequence
+        self.monitor = monitor
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __getitem__(self, index):
+        start = time.perf_counter()
+        batch = self.sequence[index]
+        ready = time.perf_counter()
+        self.monitor._batch_ready(ready, ready - start, len(batch[0]))
+        return batch
+
+    def on_epoch_end(self):
+        self.sequence.on_epoch_end()
+
+    def __getattr__(self, name):
+        # Expose classes, samples, etc. of the wrapped iterator
+        return getattr(self.sequence, name)
+
+
+class ThroughputMonitor(tf.keras.callbacks.Callback):
+    """Per-step data-wait/compute timing, images/sec and peak RSS to JSONL"""
+
+    def __init__(self, run_name, log_path=LOG_PATH, batch_size=None,
+                 profile_steps=None, profile_dir=PROFILE_DIR):
+        super().__init__()
+        self.run_name = run_name
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.profile_steps = profile_steps
+        self.profile_dir = profile_dir
+        self._ready = deque()
+        self._log = None
+        self._profiling = False
+        self.global_step = 0
+        self._traced = False
+
+    def wrap(self, data):
+        """Time batch production of a Keras Sequence/iterator or a tf.data.Dataset"""
+        if isinstance(data, tf.data.Dataset):
+            return self._wrap_dataset(data)
+        return TimedSequence(data, self)
+
+    def _wrap_dataset(self, dataset):
+        def ready(size):
+            self._batch_ready(time.perf_counter(), None, int(size))
+            return 0
+
+        def stamp(*batch):
+            done = tf.py_function(ready, [tf.shape(tf.nest.flatten(batch)[0])[0]], tf.int32)
+            with tf.control_dependencies([done]):
+                return tf.nest.map_structure(tf.identity, batch)
+
+        # Sequential map keeps batch order, so timings pair up with steps like TimedSequence's
+        return dataset.map(stamp).prefetch(tf.data.AUTOTUNE)
+
+    def _batch_ready(self, ready_time, fetch_time, size):
+        self._ready.append((ready_time, fetch_time, size))
+
+    def on_train_begin(self, logs=None):
+        # Drop the batch Keras peeks at to infer shapes before training starts
+        self._ready.clear()
+        self._traced = False
+        self._log = open(self.log_path, 'a')
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.epoch_start = time.perf_counter()
+        self.epoch_images = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.profile_steps and self.global_step == self.profile_steps[0]:
+            tf.profiler.experimental.start(self.profile_dir)
+            self._profiling = True
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        step_end = time.perf_counter()
+        step_time = step_end - self.step_start
+
+        ready_time, fetch_time, size = self._ready.popleft() if self._ready else (None, None, self.batch_size)
+        # Without input timing the split between waiting and compute is unknown, not zero
+        data_wait = None
+        # The first step of a fit() traces the train function, and a tf.data pipeline only starts when the
+        # traced step asks for its first batch, so that wait is mostly tracing
+        if ready_time is not None and self._traced:
+            data_wait = min(max(0.0, ready_time - self.step_start), step_time)
+        self._traced = True
+
+        self.epoch_images += size or 0
+        self._write({
+            'type': 'step',
+            'run': self.run_name,
+            'epoch': self.epoch,
+            'step': batch,
+            'global_step': self.global_step,
+            'step_ms': round(step_time * 1000, 3),
+            'data_wait_ms': round(data_wait * 1000, 3) if data_wait is not None else None,
+            'compute_ms': round((step_time - data_wait) * 1000, 3) if data_wait is not None else None,
+            'fetch_ms': round(fetch_time * 1000, 3) if fetch_time is not None else None,
+            'images_per_sec': round(size / step_time, 2) if size else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        })
+
+        self.global_step += 1
+        if self._profiling and self.global_step >= self.profile_steps[1]:
+            self._stop_profiler()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        self._write({
+            'type': 'epoch',
+            'run': self.run_name,
+            'epoch': epoch,
+            'epoch_s': round(elapsed, 3),
+            'images': self.epoch_images,
+            'images_per_sec': round(self.epoch_images / elapsed, 2) if elapsed else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        })
+        self._log.flush()
+
+    def on_train_end(self, logs=None):
+        if self._profiling:
+            self._stop_profiler()
+        self._log.close()
+        self._log = None
+
+    def _stop_profiler(self):
+        tf.profiler.experimental.stop()
+        self._profiling = False
+        print(f"📈 Profiler trace saved to {self.profile_dir} (open with TensorBoard)")
+
+    def _write(self, record):
+        self._log.write(json.dumps(record) + '\n')